@@ -7,47 +7,546 @@
 6. Undo/Redo changes
 7. Save the edited image
 9. Show status messages
-10. Add Keyboard shortcuts"""
+10. Add Keyboard shortcuts
+11. Zoom and pan large images on the canvas
+12. Keep several images open, each with its own undo history
+13. Browse through the images of a folder"""
+
+import time
+STARTUP_TIME = time.perf_counter()  # for --profile-startup
 
 #import required libraries for the app
 import tkinter as tk
-from tkinter import filedialog, messagebox, Scale
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
+from tkinter import filedialog, messagebox, simpledialog, Scale
 import os
+import sys
+import math
+import queue
+import argparse
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tracing import OperationTracer
+TK_IMPORTED_TIME = time.perf_counter()
+
+# The imaging stack (OpenCV, numpy, Pillow and the editor modules built on them) takes
+# much longer to import than Tk needs to show the window. It is imported on a background
+# thread by import_imaging() once the window is being built, these names are set then.
+cv2 = np = Image = ImageTk = None
+TILE_SIZE = Document = DocumentSession = EditState = ImagePyramid = None
+folder_images = read_image = pil_image = resample_filter = scaled_size = None
+EXPORT_DEFAULTS = TIFF_COMPRESSIONS = TIFF_TILE_SIZES = None
+export_format = export_image = export_set = parse_size = direct_crop = None
+
+
+def import_imaging():
+    """Import the imaging stack into this module's namespace"""
+    global cv2, np, Image, ImageTk
+    global TILE_SIZE, Document, DocumentSession, EditState, ImagePyramid
+    global folder_images, read_image, pil_image, resample_filter, scaled_size
+    global EXPORT_DEFAULTS, TIFF_COMPRESSIONS, TIFF_TILE_SIZES, export_format, export_image
+    global export_set, parse_size, direct_crop
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageTk
+    from editor_core import (TILE_SIZE, Document, DocumentSession, EditState, ImagePyramid,
+                             folder_images, read_image, pil_image, resample_filter, scaled_size)
+    from exporter import (EXPORT_DEFAULTS, TIFF_COMPRESSIONS, TIFF_TILE_SIZES, export_format,
+                          export_image, export_set, parse_size)
+    from direct_crop import direct_crop
+
+
+class ImagingLoader:
+    """Runs import_imaging() on a background thread, wait() blocks until it is done and
+    raises the error if it failed (an ImportError, or whatever a broken install raised)"""
+    def __init__(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.error = None
+        self.seconds = None
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            import_imaging()
+        except Exception as e:
+            self.error = e
+        self.seconds = time.perf_counter() - start
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def wait(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def show_dependency_error(error):
+    messagebox.showerror(
+        "Dependency Error",
+        "A required library is missing:\n\n{}\n\n"
+        "Install missing dependencies with:\n"
+        "pip install pillow opencv-python numpy".format(error)
+    )
+
+# How many rendered tiles to keep around for reuse while zooming and panning
+TILE_CACHE_SIZE = 256
+# How many rendered panel thumbnails to keep, revisiting a history state reuses them
+PANEL_CACHE_SIZE = 64
+# Side length of the original and cropped/resized panel thumbnails
+PANEL_SIZE = 300
+# Side length of the document thumbnails in the filmstrip
+FILMSTRIP_SIZE = 64
+# Zoom limits and the factor applied per mouse wheel step
+MAX_ZOOM = 16.0
+ZOOM_STEP = 1.25
+# Names of editor_core.QUALITY_TIERS, listed here for the menu that is built before the
+# imaging stack is loaded
+QUALITY_TIER_NAMES = ("draft", "balanced", "high")
+# Quality tier the canvas is refined to once zooming, panning or sliding stops for
+# REFINE_DELAY_MS, while interacting it is drawn with the draft tier
+DISPLAY_QUALITY = "high"
+REFINE_DELAY_MS = 150
+# Slider ticks arriving within this many ms are merged into a single preview
+PREVIEW_DELAY_MS = 30
+# Keyboard/trough changes of the slider are committed after this much idle time
+COMMIT_DELAY_MS = 500
+# Images larger than this (longest side) first open as a reduced preview of at most this size
+FAST_OPEN_PREVIEW_SIZE = 2048
+# EXIF tag of the orientation (rotation/mirroring) a camera stores instead of rotating
+EXIF_ORIENTATION = 0x0112
+# Files decoded ahead on each side of the current one while browsing a folder
+PREFETCH_RADIUS = 2
+# Worker threads for decoding, encoding and resampling, and how often Tk collects results
+JOB_WORKERS = 2
+JOB_POLL_MS = 15
+# Sizes the export set dialog suggests the first time
+EXPORT_SET_SIZES = "100%, 50%, 256px"
+# How often the window checks whether the background imports have finished
+IMAGING_POLL_MS = 50
+# Track array memory of every operation with tracemalloc (slows everything down, so only
+# with --trace-memory)
+TRACE_MEMORY = False
+
+
+def document_field(name, default=None):
+    """App attribute that reads and writes a field of the active document, so the editing
+    code works on self.state, self.history... of whichever document is shown"""
+    def get(self):
+        doc = self.doc
+        return getattr(doc, name) if doc is not None else default
+
+    def set(self, value):
+        setattr(self.doc, name, value)
+    return property(get, set)
+
+
+def traced(name):
+    """Record the decorated method as operation name in the app's tracer"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                result = func(self, *args, **kwargs)
+            if threading.current_thread() is threading.main_thread():
+                self.update_trace_status()
+            return result
+        return wrapper
+    return decorate
+
+
+class Viewport:
+    """Zoom/pan state of the canvas, draws only the visible tiles of an ImagePyramid.
+    The image shown is the box rectangle of the pyramid scaled to size, so crops and
+    resizes of an EditState are displayed straight from the original's pyramid."""
+    def __init__(self, canvas, width, height, tracer=None):
+        self.canvas = canvas
+        self.tracer = tracer
+        self.width = width
+        self.height = height
+        self.pyramid = None
+        self.box = (0, 0, 0, 0)
+        self.size = (0, 0)
+        self.zoom = 1.0
+        self.fit_zoom = 1.0
+        # position of the canvas top-left corner inside the zoomed image, in screen pixels
+        self.origin = (0, 0)
+        self.tiles = OrderedDict()  # LRU cache of tile PhotoImages
+        self.visible = []  # PhotoImages currently on the canvas, Tk needs the references
+
+    @property
+    def image_size(self):
+        return self.size
+
+    def set_view(self, pyramid, box=None, size=None, keep_view=False):
+        """Show box of pyramid (default: all of it) at size, keep_view keeps zoom and pan
+        when the displayed size did not change. Cached tiles are keyed by pyramid version,
+        so going back to an earlier image or state reuses whatever is still cached."""
+        box = box or (0, 0, pyramid.width, pyramid.height)
+        size = size or (round(box[2] - box[0]), round(box[3] - box[1]))
+        same_size = self.pyramid is not None and self.size == size
+        self.pyramid = pyramid
+        self.box = box
+        self.size = size
+        if not (keep_view and same_size):
+            self.fit()
+
+    def show_state(self, state, keep_view=False):
+        self.set_view(state.source, state.box, state.size, keep_view)
+
+    def resize(self, width, height):
+        self.width = max(1, width)
+        self.height = max(1, height)
+        if self.pyramid is not None:
+            if self.zoom == self.fit_zoom:
+                self.fit()
+            else:
+                self.fit_zoom = self.compute_fit_zoom()
+                self.clamp_origin()
+
+    def compute_fit_zoom(self):
+        img_w, img_h = self.image_size
+        return min(self.width / img_w, self.height / img_h, 1.0)
+
+    def fitted_size(self, img_w, img_h):
+        """Size an image of img_w x img_h takes on the canvas when fitted"""
+        zoom = min(self.width / img_w, self.height / img_h, 1.0)
+        return (max(1, round(img_w * zoom)), max(1, round(img_h * zoom)))
+
+    def fit(self):
+        """Show the whole image centered, never enlarged beyond 100%"""
+        self.fit_zoom = self.compute_fit_zoom()
+        self.zoom = self.fit_zoom
+        self.clamp_origin()
+
+    def clamp_origin(self):
+        """Center axes that fit on the canvas and keep the others inside the image"""
+        img_w, img_h = self.image_size
+        ox, oy = self.origin
+        zoomed_w = round(img_w * self.zoom)
+        zoomed_h = round(img_h * self.zoom)
+        if zoomed_w <= self.width:
+            ox = -((self.width - zoomed_w) // 2)
+        else:
+            ox = min(max(0, ox), zoomed_w - self.width)
+        if zoomed_h <= self.height:
+            oy = -((self.height - zoomed_h) // 2)
+        else:
+            oy = min(max(0, oy), zoomed_h - self.height)
+        self.origin = (ox, oy)
+
+    def canvas_to_image(self, x, y):
+        """Map a canvas point to (fractional) full resolution image coordinates"""
+        ox, oy = self.origin
+        return ((x + ox) / self.zoom, (y + oy) / self.zoom)
+
+    def image_to_canvas(self, x, y):
+        ox, oy = self.origin
+        return (x * self.zoom - ox, y * self.zoom - oy)
+
+    def zoom_at(self, factor, x, y):
+        """Zoom by factor keeping the image point under canvas point (x, y) in place"""
+        if self.pyramid is None:
+            return
+        img_x, img_y = self.canvas_to_image(x, y)
+        self.zoom = min(MAX_ZOOM, max(self.fit_zoom, self.zoom * factor))
+        self.origin = (round(img_x * self.zoom - x), round(img_y * self.zoom - y))
+        self.clamp_origin()
+
+    def pan(self, dx, dy):
+        ox, oy = self.origin
+        self.origin = (ox - dx, oy - dy)
+        self.clamp_origin()
+
+    def render(self, quality="balanced"):
+        if self.tracer:
+            with self.tracer.span(f"canvas_render.{quality}"):
+                self.draw_tiles(quality)
+        else:
+            self.draw_tiles(quality)
+
+    def draw_tiles(self, quality):
+        """Place the tiles intersecting the canvas, resampling only those not cached"""
+        self.canvas.delete("tile")
+        self.visible = []
+        if self.pyramid is None:
+            return
+        bx0, by0, bx1, by1 = self.box
+        # screen pixels per full resolution source pixel
+        kx = self.zoom * self.size[0] / (bx1 - bx0)
+        ky = self.zoom * self.size[1] / (by1 - by0)
+        level = self.pyramid.level_for_zoom(kx, quality)
+        level_img = self.pyramid.levels[level]
+        level_h, level_w = level_img.shape[:2]
+        sx, sy = self.pyramid.width / level_w, self.pyramid.height / level_h
+        # screen pixels per level pixel, and the box in level pixels
+        fx, fy = kx * sx, ky * sy
+        lbx0, lby0 = math.floor(bx0 / sx), math.floor(by0 / sy)
+        lbx1, lby1 = min(level_w, math.ceil(bx1 / sx)), min(level_h, math.ceil(by1 / sy))
+        # when zoomed past 100% use smaller source tiles so screen tiles stay TILE_SIZE
+        step = TILE_SIZE if max(fx, fy) <= 1 else max(1, math.ceil(TILE_SIZE / max(fx, fy)))
+        ox, oy = self.origin
+        tx0 = max(lbx0, int((ox + bx0 * kx) / fx)) // step
+        ty0 = max(lby0, int((oy + by0 * ky) / fy)) // step
+        tx1 = min(math.ceil(lbx1 / step), int((ox + self.width + bx0 * kx) / fx) // step + 1)
+        ty1 = min(math.ceil(lby1 / step), int((oy + self.height + by0 * ky) / fy) // step + 1)
+        # extent of the box on the zoomed image, the whole level pixels of the edge tiles
+        # can reach past it and are cut off so only the box is shown
+        ex1, ey1 = round(self.size[0] * self.zoom), round(self.size[1] * self.zoom)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                lx0, ly0 = max(lbx0, tx * step), max(lby0, ty * step)
+                lx1, ly1 = min(lbx1, tx * step + step), min(lby1, ty * step + step)
+                # tile edges are rounded in zoomed image space so neighbours never leave gaps
+                cx0, cx1 = round(lx0 * fx - bx0 * kx), round(lx1 * fx - bx0 * kx)
+                cy0, cy1 = round(ly0 * fy - by0 * ky), round(ly1 * fy - by0 * ky)
+                clip = (max(0, -cx0), max(0, -cy0), min(cx1, ex1) - cx0, min(cy1, ey1) - cy0)
+                if clip[2] <= clip[0] or clip[3] <= clip[1] or lx1 <= lx0 or ly1 <= ly0:
+                    continue
+                photo = self.get_tile(level, lx0, ly0, lx1, ly1, cx1 - cx0, cy1 - cy0, quality,
+                                      clip)
+                self.canvas.create_image(cx0 + clip[0] - ox, cy0 + clip[1] - oy, anchor="nw",
+                                         image=photo, tags="tile")
+                self.visible.append(photo)
+        self.canvas.tag_lower("tile")
+
+    def get_tile(self, level, lx0, ly0, lx1, ly1, width, height, quality, clip=None):
+        """Return the PhotoImage of one tile at screen size, from the LRU cache if possible.
+        clip (left, top, right, bottom) keeps only that part of the width x height tile."""
+        clip = clip or (0, 0, width, height)
+        key = (self.pyramid.version, level, lx0, ly0, lx1, ly1, width, height, quality, clip)
+        photo = self.tiles.get(key)
+        if photo is not None:
+            self.tiles.move_to_end(key)
+            return photo
+        tile = self.pyramid.levels[level][ly0:ly1, lx0:lx1]
+        if (width, height) != (lx1 - lx0, ly1 - ly0):
+            if width >= 2 * (lx1 - lx0):
+                # show real pixels when zoomed in so crops can be placed exactly
+                interpolation = cv2.INTER_NEAREST
+            else:
+                interpolation = resample_filter(quality, lx1 - lx0, width)
+            tile = cv2.resize(tile, (width, height), interpolation=interpolation)
+        if clip != (0, 0, width, height):
+            tile = tile[clip[1]:clip[3], clip[0]:clip[2]]
+        photo = ImageTk.PhotoImage(pil_image(tile))
+        if self.tracer:
+            self.tracer.count("photos")
+        self.tiles[key] = photo
+        while len(self.tiles) > TILE_CACHE_SIZE:
+            self.tiles.popitem(last=False)
+        return photo
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it was cancelled or superseded"""
+
+
+class Job:
+    """Handle of a background job, used by the job itself to report progress and stop early"""
+    def __init__(self, key, executor):
+        self.key = key
+        self.executor = executor
+        self.cancelled = False
+        self.future = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, fraction, msg=""):
+        self.check()
+        self.executor.results.put(("progress", self, None, (fraction, msg)))
+
+
+class JobExecutor:
+    """Thread pool for heavy image work, results are handed back to the Tk thread
+    through root.after. Jobs have a key, submitting a job with the key of a running
+    one cancels the old job and its result is dropped instead of delivered."""
+    def __init__(self, root, on_progress=None, on_error=None, workers=JOB_WORKERS):
+        self.root = root
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.results = queue.Queue()
+        self.active = {}
+        self.poll_id = None
+
+    def submit(self, key, func, *args, on_done=None, on_error=None):
+        """Run func(job, *args) on a worker thread, on_done(result) is called on the Tk thread"""
+        self.cancel(key)
+        job = Job(key, self)
+        self.active[key] = job
+        job.future = self.pool.submit(self.run, job, func, args, on_done, on_error or self.on_error)
+        if self.poll_id is None:
+            self.poll_id = self.root.after(JOB_POLL_MS, self.poll)
+        return job
+
+    def run(self, job, func, args, on_done, on_error):
+        try:
+            result = func(job, *args)
+            job.check()
+            self.results.put(("done", job, on_done, result))
+        except JobCancelled:
+            pass
+        except Exception as e:
+            self.results.put(("error", job, on_error, e))
+
+    def busy(self, key):
+        return key in self.active
+
+    def cancel(self, key):
+        job = self.active.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self, keep=()):
+        for key in list(self.active):
+            if key not in keep:
+                self.cancel(key)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
+
+    def poll(self):
+        """Tk thread: deliver progress and results, stale jobs are silently dropped"""
+        self.poll_id = None
+        while True:
+            try:
+                kind, job, callback, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled or self.active.get(job.key) is not job:
+                continue
+            if kind == "progress":
+                if self.on_progress:
+                    self.on_progress(job, *value)
+                continue
+            del self.active[job.key]
+            if callback is None:
+                continue
+            if kind == "error":
+                callback(job, value)
+            else:
+                callback(value)
+        if self.active:
+            self.poll_id = self.root.after(JOB_POLL_MS, self.poll)
+
 
 # defining the main image editor application class
 class CenteredImageEditorApp:
-    def __init__(self, root):
+    # Every open image is a Document of the session, these are the active one's.
+    # Edits never touch pixels: state records crop/resize operations against the
+    # pyramid of the original image in source, pixels are computed when needed.
+    source = document_field("source")
+    state = document_field("state")
+    history = document_field("history")
+    # True while source is a reduced preview and the full decode is still running
+    preview_loading = document_field("preview", False)
+
+    def __init__(self, root, profile_startup=False, trace_memory=TRACE_MEMORY):
         self.root = root
         self.root.title("Image Editor")
+        # import the imaging stack while the window is built, see ensure_imaging()
+        self.imaging = ImagingLoader()
+        self.imaging.start()
+        self.profile_startup = profile_startup
+        self.startup_marks = {"tk_imported": TK_IMPORTED_TIME}
+        self.pending_open = None  # file to open as soon as the imaging stack is ready
 
-        # Initialize variables to hold images and cropping details
-        self.image = None
-        self.original_image = None
-        self.cropped_image = None
-        self.resized_image = None
+        # Initialize the open documents (created with the imaging stack) and cropping details
+        self.session = None
         self.rect_start = None
         self.rect_end = None
         self.rect_id = None
-        self.undo_stack = []
-        self.redo_stack = []
-        self.image_path = None
+        self.tracer = OperationTracer(trace_memory)
+        self.export_options = None  # last settings chosen in the export dialog
+        self.export_set_sizes = EXPORT_SET_SIZES  # last sizes of an export set
+        self.panel_cache = OrderedDict()  # LRU of panel PhotoImages by (state key, size)
+        # decoded neighbours of the current file for folder browsing: path -> load result
+        self.prefetched = OrderedDict()
+        self.jobs = JobExecutor(self.root, self.on_job_progress, self.on_job_error)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # The size for the Canvas of image loading
         self.canvas_width = 600
         self.canvas_height = 400
 
+        self.resample = None  # Pillow's LANCZOS filter, set with the imaging stack
+
+        # setup user interface and key bindings
+        self.setup_ui()
+        self.bind_shortcuts()
+        self.root.bind("<Map>", self.on_first_map, add="+")
+        self.root.after(IMAGING_POLL_MS, self.check_imaging)
+
+    def on_first_map(self, event):
+        if "window" not in self.startup_marks:
+            self.startup_marks["window"] = time.perf_counter()
+            self.check_startup_done()
+
+    def check_imaging(self):
+        """Tk thread: finish setting up once the background imports are done"""
+        if self.imaging.done():
+            self.ensure_imaging()
+        else:
+            self.root.after(IMAGING_POLL_MS, self.check_imaging)
+
+    def ensure_imaging(self):
+        """Make sure the imaging stack is loaded, waiting for the background import if it
+        is still running. Everything that touches pixels goes through here first."""
+        if self.session is not None:
+            return True
+        try:
+            self.imaging.wait()
+        except Exception as e:
+            show_dependency_error(e)
+            return False
+        self.session = DocumentSession()
+        self.export_options = dict(EXPORT_DEFAULTS)
         # Resampling method of handling Pillow's for compatibility
         try:
             self.resample = Image.Resampling.LANCZOS
         except AttributeError:
             self.resample = Image.LANCZOS
-            
-        # setup user interface and key bindings
-        self.setup_ui()
-        self.bind_shortcuts()
+        self.startup_marks["imaging"] = time.perf_counter()
+        if self.pending_open:
+            path, self.pending_open = self.pending_open, None
+            self.open_path(path)
+        self.check_startup_done()
+        return True
+
+    def check_startup_done(self):
+        """--profile-startup: print the startup times and quit once the window, the
+        imaging stack and (when one was given) the first image are shown"""
+        if not self.profile_startup:
+            return
+        marks = self.startup_marks
+        if "window" not in marks or "imaging" not in marks:
+            return
+        if "open_requested" in marks and "first_image" not in marks:
+            return
+        def ms(mark):
+            return f"{(marks[mark] - STARTUP_TIME) * 1000:8.0f} ms"
+        print("Startup profile (time since the script started):")
+        print(f"  Tk and light imports {ms('tk_imported')}")
+        print(f"  first window         {ms('window')}")
+        print(f"  imaging stack ready  {ms('imaging')}  "
+              f"(imported in {self.imaging.seconds * 1000:.0f} ms on a background thread)")
+        if "first_image" in marks:
+            print(f"  first image shown    {ms('first_image')}")
+        sys.stdout.flush()
+        self.root.after(0, self.on_close)
 
     def setup_ui(self):
         """Create all UI components: button, canvas, labels, scale"""
@@ -62,6 +561,9 @@ class CenteredImageEditorApp:
         save_btn = tk.Button(btn_frame, text="Save Image (Ctrl+S)", command=self.save_image)
         save_btn.pack(side=tk.LEFT, padx=5)
 
+        export_set_btn = tk.Button(btn_frame, text="Export Sizes...", command=self.save_image_set)
+        export_set_btn.pack(side=tk.LEFT, padx=5)
+
         reset_btn = tk.Button(btn_frame, text="Reset", command=self.reset_image)
         reset_btn.pack(side=tk.LEFT, padx=5)
 
@@ -71,21 +573,56 @@ class CenteredImageEditorApp:
         redo_btn = tk.Button(btn_frame, text="Redo (Ctrl+Y)", command=self.redo)
         redo_btn.pack(side=tk.LEFT, padx=5)
 
+        close_btn = tk.Button(btn_frame, text="Close (Ctrl+W)", command=self.close_document)
+        close_btn.pack(side=tk.LEFT, padx=5)
+
+        # Resampling quality of the canvas once it is idle, interaction always uses draft
+        self.quality_var = tk.StringVar(value=DISPLAY_QUALITY)
+        quality_menu = tk.OptionMenu(btn_frame, self.quality_var, *QUALITY_TIER_NAMES,
+                                     command=self.on_quality_change)
+        quality_menu.pack(side=tk.RIGHT, padx=5)
+        tk.Label(btn_frame, text="Quality:").pack(side=tk.RIGHT)
+        self.refine_job = None
+
+        # Filmstrip of the open images, click one to switch (Ctrl+Tab / Ctrl+Shift+Tab)
+        self.filmstrip = tk.Frame(self.root)
+        self.filmstrip.pack(fill=tk.X, padx=5)
+
         # Creating Canvas to display images
-        self.canvas = tk.Canvas(self.root, cursor="cross", bg="gray",
+        self.canvas = tk.Canvas(self.root, cursor="cross", bg="#808080",
                                width=self.canvas_width, height=self.canvas_height)
         self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.viewport = Viewport(self.canvas, self.canvas_width, self.canvas_height, self.tracer)
+        self.pan_start = None
 
         # Mouse bindings to canvas for cropping image
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
 
+        # Mouse bindings for zooming (wheel) and panning (right or middle drag)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self.on_pan_drag)
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+
         # Scale widget to resize cropped image
+        # While dragging, ticks only update a cheap preview, the real resize runs on release
         self.scale = Scale(self.root, from_=10, to=200, orient="horizontal",
-                           label="Resize Cropped Image (%)", command=self.resize_image)
+                           label="Resize Cropped Image (%)", command=self.on_scale_change)
         self.scale.set(100)
         self.scale.pack(fill=tk.X, padx=10, pady=5)
+        self.scale.bind("<ButtonPress-1>", self.on_scale_press)
+        self.scale.bind("<ButtonRelease-1>", self.on_scale_release)
+        self.committed_scale = 100
+        self.slider_dragging = False
+        self.preview_job = None
+        self.commit_job = None
+        self.preview_active = False
+        self.scale_base = None
 
         # Creating frame to show original and cropped image thumbnails
         img_frame = tk.Frame(self.root)
@@ -99,10 +636,23 @@ class CenteredImageEditorApp:
 
         # Creating status bar to show current operation information
         self.status_var = tk.StringVar()
-        self.status_bar = tk.Label(self.root, textvariable=self.status_var,
+        status_frame = tk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = tk.Label(status_frame, textvariable=self.status_var,
                                    bd=1, relief=tk.SUNKEN, anchor=tk.W)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.memory_var = tk.StringVar()
+        self.memory_bar = tk.Label(status_frame, textvariable=self.memory_var,
+                                   bd=1, relief=tk.SUNKEN, anchor=tk.E)
+        self.memory_bar.pack(side=tk.RIGHT)
+        # live timing of the last operation and the most expensive ones (Ctrl+T exports)
+        self.trace_var = tk.StringVar()
+        self.trace_bar = tk.Label(self.root, textvariable=self.trace_var,
+                                  bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.trace_bar.pack(side=tk.BOTTOM, fill=tk.X)
         self.set_status("Ready")
+        self.update_memory_status()
+        self.update_trace_status()
 
     def bind_shortcuts(self):
         """Defining the bind keyboard shortcuts for common actions"""
@@ -110,74 +660,404 @@ class CenteredImageEditorApp:
         self.root.bind("<Control-y>", self.handle_redo)
         self.root.bind("<Control-o>", self.handle_load)
         self.root.bind("<Control-s>", self.handle_save)
+        self.root.bind("<Control-equal>", self.handle_zoom_in)
+        self.root.bind("<Control-plus>", self.handle_zoom_in)
+        self.root.bind("<Control-minus>", self.handle_zoom_out)
+        self.root.bind("<Control-0>", self.handle_zoom_fit)
+        self.root.bind("<Escape>", self.handle_cancel)
+        self.root.bind("<Control-t>", self.handle_export_trace)
+        self.root.bind("<Control-w>", self.handle_close)
+        self.root.bind("<Next>", self.handle_next_file)
+        self.root.bind("<Prior>", self.handle_previous_file)
+        self.root.bind("<Alt-Right>", self.handle_next_file)
+        self.root.bind("<Alt-Left>", self.handle_previous_file)
+        self.root.bind("<Control-Tab>", self.handle_next_document)
+        self.root.bind("<Control-Shift-Tab>", self.handle_previous_document)
+        # X11 reports Shift+Tab as ISO_Left_Tab
+        self.root.bind("<Control-ISO_Left_Tab>", self.handle_previous_document)
 
     def set_status(self, msg):
         """update the status bar with a message"""
         self.status_var.set(msg)
 
+    def update_memory_status(self):
+        """Show how much memory and disk the undo/redo history and the open documents use"""
+        if self.doc is None:
+            self.memory_var.set("No image open")
+            return
+        stats = self.history.stats()
+        text = (f"History: {len(self.history.undo_stack)} undo / {len(self.history.redo_stack)} redo, "
+                f"{stats['memory_bytes'] / (1024 * 1024):.1f} MB RAM")
+        if stats["disk_bytes"] or self.history.misses:
+            text += (f", {stats['disk_bytes'] / (1024 * 1024):.1f} MB disk, "
+                     f"hit {stats['hit_rate'] * 100:.0f}%, restore {stats['avg_restore_ms']:.0f} ms")
+        if len(self.session.documents) > 1:
+            text += (f" | {len(self.session.documents)} images, "
+                     f"{self.session.memory_bytes() / (1024 * 1024):.0f} of "
+                     f"{self.session.budget_bytes / (1024 * 1024):.0f} MB")
+        self.memory_var.set(text)
+
+    def update_trace_status(self):
+        self.trace_var.set(self.tracer.summary())
+
+    def export_trace(self):
+        """Save the timings of this session as a Chrome trace JSON file"""
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("Trace JSON", "*.json")])
+        if path:
+            try:
+                self.tracer.export(path)
+                self.set_status(f"Trace saved: {os.path.basename(path)}")
+            except OSError as e:
+                messagebox.showerror("Error", str(e))
+
+    def on_job_progress(self, job, fraction, msg):
+        if job.key.startswith("prefetch:"):
+            return
+        self.set_status(f"{msg}... {fraction * 100:.0f}% (Esc to cancel)")
+
+    def on_job_error(self, job, error):
+        messagebox.showerror("Error", str(error))
+        self.set_status(str(error))
+
     def load_image(self):
         """creating image loading funcitonality to load image from device folder and display it to canvas"""
         path = filedialog.askopenfilename(
             filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp *.tiff")])
         if path:
-            img = cv2.imread(path)
-            if img is None:
-                messagebox.showerror("Error", "Failed to load image.")
-                self.set_status("Failed to load image.")
-                return
-            self.image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            self.original_image = self.image.copy()
-            self.cropped_image = None
-            self.resized_image = None
-            self.undo_stack.clear()
-            self.redo_stack.clear()
-            self.image_path = path
-            self.display_image(self.image, self.original_panel, os.path.basename(path))
-            self.display_image(np.ones((100, 100, 3), dtype=np.uint8)*220,
-                               self.cropped_panel, text="Cropped/Resized Image")
-            self.show_on_canvas_centered(self.image)
-            self.scale.set(100)
-            self.set_status(f"Loaded: {os.path.basename(path)} ({self.image.shape[1]}x{self.image.shape[0]})")
+            self.open_path(path)
+
+    def open_path(self, path):
+        """Decode a file in the background and open it as a new document"""
+        self.startup_marks.setdefault("open_requested", time.perf_counter())
+        if self.session is None and not self.imaging.done():
+            # still importing: open it when the imports are done instead of blocking Tk
+            self.pending_open = path
+            self.set_status(f"Starting up, {os.path.basename(path)} opens in a moment...")
+            return
+        if not self.ensure_imaging():
+            return
+        self.jobs.submit(f"load:{path}", self.decode_preview, path, on_done=self.on_preview_loaded)
+        self.set_status(f"Loading {os.path.basename(path)}...")
+
+    @traced("load.decode_preview")
+    def decode_preview(self, job, path):
+        """Worker: decode big images at reduced resolution (JPEG decodes this in the DCT
+        domain, so it is much faster than a full decode), small ones are decoded fully"""
+        job.progress(0.0, "Reading header")
+        try:
+            with Image.open(path) as header:
+                width, height = header.size
+                # the reduced decode applies the EXIF rotation, the header size doesn't
+                if header.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+                    width, height = height, width
+        except Exception:
+            width = height = 0
+        factor = 1
+        while factor < 8 and max(width, height) / factor > FAST_OPEN_PREVIEW_SIZE:
+            factor *= 2
+        if factor == 1:
+            return self.decode_image(job, path) + (False,)
+        flag = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8}[factor]
+        job.progress(0.2, f"Decoding 1/{factor} preview")
+        img = read_image(path, flag)
+        if img is None or max(abs(img.shape[0] * factor - height),
+                              abs(img.shape[1] * factor - width)) >= factor:
+            # not what the header promised, only a full decode gives the real size
+            return self.decode_image(job, path) + (False,)
+        return path, ImagePyramid(img, size=(width, height), check=job.check), True
 
+    @traced("load")
+    def on_preview_loaded(self, result, replace=None):
+        """Open the decoded image as a new document next to the ones already open, or in
+        place of the document replace (browsing on from an image that was not edited)"""
+        path, pyramid, is_preview = result
+        self.store_view()
+        doc = Document(path, pyramid, preview=is_preview)
+        if replace is not None and replace in self.session.documents and not replace.edited:
+            self.session.replace(replace, doc)
+        else:
+            self.session.add(doc)
+        self.show_document()
+        if "first_image" not in self.startup_marks:
+            self.root.update_idletasks()
+            self.startup_marks["first_image"] = time.perf_counter()
+            self.check_startup_done()
+        self.prefetch_neighbours()
+        if is_preview:
+            self.set_status(f"Preview of {os.path.basename(path)} ({pyramid.width}x{pyramid.height}), "
+                            "loading full resolution...")
+        else:
+            self.set_status(f"Loaded: {os.path.basename(path)} ({pyramid.width}x{pyramid.height})")
+
+    def browse(self, step):
+        """Open the file step places after the current one in its folder, from the
+        prefetch cache when it is already decoded"""
+        if self.doc is None:
+            return
+        files = folder_images(os.path.dirname(self.doc.path))
+        if self.doc.path not in files:
+            self.set_status("The current image is no longer in its folder.")
+            return
+        index = files.index(self.doc.path) + step
+        if not 0 <= index < len(files):
+            self.set_status("Last image of the folder." if step > 0 else "First image of the folder.")
+            return
+        path = files[index]
+        replace = self.doc
+        result = self.prefetched.get(path)
+        if result is not None:
+            self.prefetched.move_to_end(path)
+            self.on_preview_loaded(result, replace)
+            self.set_status(f"{os.path.basename(path)} ({index + 1}/{len(files)})")
+        else:
+            self.jobs.submit(f"load:{path}", self.decode_preview, path,
+                             on_done=lambda result: self.on_preview_loaded(result, replace))
+            self.set_status(f"Loading {os.path.basename(path)} ({index + 1}/{len(files)})...")
+
+    def prefetch_neighbours(self):
+        """Decode the files around the current one in the background, nearest first, and
+        forget the ones that moved out of range"""
+        if self.doc is None:
+            return
+        files = folder_images(os.path.dirname(self.doc.path))
+        if self.doc.path not in files:
+            return
+        index = files.index(self.doc.path)
+        wanted = []
+        for distance in range(1, PREFETCH_RADIUS + 1):
+            for i in (index + distance, index - distance):
+                if 0 <= i < len(files):
+                    wanted.append(files[i])
+        for path in list(self.prefetched):
+            if path not in wanted:
+                del self.prefetched[path]
+        for key in list(self.jobs.active):
+            if key.startswith("prefetch:") and key[len("prefetch:"):] not in wanted:
+                self.jobs.cancel(key)
+        for path in wanted:
+            if path not in self.prefetched and not self.jobs.busy(f"prefetch:{path}"):
+                self.jobs.submit(f"prefetch:{path}", self.decode_prefetch, path,
+                                 on_done=self.on_prefetched, on_error=lambda job, error: None)
+
+    @traced("prefetch")
+    def decode_prefetch(self, job, path):
+        """Worker: decode a neighbouring file like an open would and render its thumbnails"""
+        result = self.decode_preview(job, path)
+        state = EditState(result[1])
+        return result, {size: state.thumbnail(size) for size in (PANEL_SIZE, FILMSTRIP_SIZE)}
+
+    def on_prefetched(self, prefetch):
+        result, thumbnails = prefetch
+        self.prefetched[result[0]] = result
+        # the document opened from this result starts with the same state key
+        state = EditState(result[1])
+        for size, img in thumbnails.items():
+            self.state_photo(state, size, img)
+
+    def load_full_resolution(self, doc):
+        """Decode the full pixels of a document that only holds a preview"""
+        self.jobs.submit("load_full", self.decode_image, doc.path,
+                         on_done=lambda result: self.on_full_loaded(doc, result))
+
+    @traced("load.swap_full")
+    def on_full_loaded(self, doc, result):
+        """Swap the full resolution pixels in, edits are in full resolution coordinates
+        already so every state just gets the new source"""
+        path, pyramid = result
+        if doc not in self.session.documents or not doc.preview:
+            return
+        if (pyramid.width, pyramid.height) != (doc.source.width, doc.source.height):
+            # the edits are in the coordinates of the preview, they would land elsewhere
+            messagebox.showwarning(
+                "Warning", f"{doc.name} is {pyramid.width}x{pyramid.height} now, not "
+                f"{doc.source.width}x{doc.source.height}: it changed on disk since it was "
+                "opened. Keeping the preview, open the file again to edit the new version.")
+            self.set_status(f"Full resolution not loaded: {doc.name} changed on disk")
+            return
+        doc.set_source(pyramid)
+        self.session.enforce_budget()
+        self.update_memory_status()
+        if doc is self.doc:
+            self.display_state(EditState(pyramid), self.original_panel, doc.name)
+            self.show_on_canvas_centered(self.state, keep_view=True)
+            self.set_status(f"Full resolution loaded: {doc.name} ({pyramid.width}x{pyramid.height})")
+
+    @traced("load.decode")
+    def decode_image(self, job, path):
+        """Worker: read an image file and build its display pyramid"""
+        job.progress(0.0, "Decoding")
+        img = read_image(path)
+        if img is None:
+            raise ValueError("Failed to load image.")
+        job.progress(0.7, "Building preview")
+        return path, ImagePyramid(img, check=job.check)
+
+    @property
+    def doc(self):
+        return self.session.active if self.session is not None else None
+
+    def store_view(self):
+        """Remember zoom and pan of the active document for when it is shown again"""
+        if self.doc is not None and self.viewport.pyramid is not None:
+            self.doc.view = (self.viewport.zoom, self.viewport.origin, self.viewport.size)
+
+    @traced("switch")
+    def show_document(self):
+        """Show the active document everywhere: canvas, panels, filmstrip and status. Only
+        previews and cached thumbnails are needed, so switching is immediate, a shrunk
+        document gets its full resolution decoded in the background."""
+        self.cancel_scale_jobs()
+        self.jobs.cancel("load_full")
+        doc = self.doc
+        if doc is None:
+            self.viewport.pyramid = None
+            self.render_canvas()
+            self.original_panel.config(image="", text="Original Image")
+            self.original_panel.image = None
+            self.clear_cropped_panel()
+            self.refresh_filmstrip()
+            self.update_memory_status()
+            self.root.title("Image Editor")
+            return
+        self.root.title(f"Image Editor - {doc.name}")
+        self.display_state(EditState(doc.source), self.original_panel, doc.name)
+        if doc.state.cropped:
+            self.display_state(doc.state, self.cropped_panel,
+                               text=f"Cropped/Resized ({doc.state.size[0]}x{doc.state.size[1]})")
+        else:
+            self.clear_cropped_panel()
+        self.viewport.show_state(doc.state)
+        if doc.view and doc.view[2] == doc.state.size:
+            self.viewport.zoom, self.viewport.origin = doc.view[:2]
+            self.viewport.clamp_origin()
+        self.render_canvas()
+        self.reset_scale()
+        self.refresh_filmstrip()
+        self.update_memory_status()
+        if doc.preview:
+            self.load_full_resolution(doc)
+
+    def switch_document(self, doc):
+        if doc is None or doc is self.doc:
+            return
+        self.store_view()
+        self.session.activate(doc)
+        self.show_document()
+        self.prefetch_neighbours()
+        self.set_status(f"{doc.name} ({doc.source.width}x{doc.source.height})"
+                        + (", loading full resolution..." if doc.preview else ""))
+
+    def close_document(self):
+        """Close the active document, its neighbour is shown"""
+        if self.doc is None:
+            return
+        name = self.doc.name
+        self.session.close(self.doc)
+        self.show_document()
+        self.prefetch_neighbours()
+        self.set_status(f"Closed {name}")
+
+    def refresh_filmstrip(self):
+        """One thumbnail button per open document, the active one is shown pressed"""
+        for child in self.filmstrip.winfo_children():
+            child.destroy()
+        for doc in self.session.documents:
+            photo = self.state_photo(doc.state, FILMSTRIP_SIZE)
+            button = tk.Button(self.filmstrip, image=photo, text=doc.name, compound=tk.TOP,
+                               width=FILMSTRIP_SIZE + 20, wraplength=FILMSTRIP_SIZE + 20,
+                               relief=tk.SUNKEN if doc is self.doc else tk.RAISED,
+                               command=lambda d=doc: self.switch_document(d))
+            button.image = photo
+            button.pack(side=tk.LEFT, padx=2, pady=2)
+
+    @traced("reset")
     def reset_image(self):
         """Reset image to its original state"""
-        if self.original_image is not None:
-            self.image = self.original_image.copy()
-            self.cropped_image = None
-            self.resized_image = None
-            self.undo_stack.clear()
-            self.redo_stack.clear()
-            self.display_image(self.image, self.original_panel,
-                               os.path.basename(self.image_path) if self.image_path else "Original Image")
-            self.display_image(np.ones((100, 100, 3), dtype=np.uint8)*220,
-                               self.cropped_panel, text="Cropped/Resized Image")
-            self.show_on_canvas_centered(self.image)
-            self.scale.set(100)
+        if self.source is not None:
+            self.state = EditState(self.source)
+            self.history.clear()
+            self.update_memory_status()
+            self.display_state(EditState(self.source), self.original_panel, self.doc.name)
+            self.clear_cropped_panel()
+            self.show_on_canvas_centered(self.state)
+            self.reset_scale()
+            self.refresh_filmstrip()
             self.set_status("Image reset to original.")
 
-    def show_on_canvas_centered(self, img):
-        """Display an image centered within the canvas"""
-        img_pil = Image.fromarray(img)
-        img_pil.thumbnail((self.canvas_width, self.canvas_height), self.resample)
-        img_width, img_height = img_pil.size
+    def clear_cropped_panel(self):
+        self.display_image(np.ones((100, 100, 3), dtype=np.uint8)*220,
+                           self.cropped_panel, text="Cropped/Resized Image")
+
+    @traced("show_on_canvas")
+    def show_on_canvas_centered(self, state, text=None, keep_view=False):
+        """Display an edit state centered within the canvas, fitted to its size. Nothing
+        is resampled up front, the viewport renders the visible tiles from the original.
+        text also updates the cropped panel."""
+        self.viewport.show_state(state, keep_view)
+        self.render_canvas()
+        if text is not None:
+            self.display_state(state, self.cropped_panel, text=text)
+            self.refresh_filmstrip()
+
+    @traced("zoom")
+    def zoom_canvas(self, factor, x=None, y=None):
+        """Zoom the canvas around a point (the canvas center by default)"""
+        if self.viewport.pyramid is None:
+            return
+        if x is None:
+            x, y = self.viewport.width / 2, self.viewport.height / 2
+        self.viewport.zoom_at(factor, x, y)
+        self.render_canvas(interactive=True)
+        self.set_status(f"Zoom: {self.viewport.zoom * 100:.0f}%")
+
+    def on_mouse_wheel(self, event):
+        if event.num == 5 or event.delta < 0:
+            self.zoom_canvas(1 / ZOOM_STEP, event.x, event.y)
+        else:
+            self.zoom_canvas(ZOOM_STEP, event.x, event.y)
+
+    def render_canvas(self, interactive=False):
+        """Draw the canvas. While zooming, panning or sliding it is drawn with the fast
+        draft tier, the chosen tier follows once things stay still for REFINE_DELAY_MS"""
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+            self.refine_job = None
+        quality = self.quality_var.get()
+        if interactive and quality != "draft":
+            self.viewport.render("draft")
+            self.refine_job = self.root.after(REFINE_DELAY_MS, self.refine_canvas)
+        else:
+            self.viewport.render(quality)
+
+    def refine_canvas(self):
+        self.refine_job = None
+        self.viewport.render(self.quality_var.get())
+
+    def on_quality_change(self, quality):
+        """Redraw with the new tier and report what a canvas render costs with it"""
+        start = time.perf_counter()
+        self.render_canvas()
+        self.set_status(f"Quality: {quality}, canvas drawn in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def on_pan_start(self, event):
+        self.pan_start = (event.x, event.y)
+
+    def on_pan_drag(self, event):
+        if self.pan_start and self.viewport.pyramid is not None:
+            self.viewport.pan(event.x - self.pan_start[0], event.y - self.pan_start[1])
+            self.pan_start = (event.x, event.y)
+            self.render_canvas(interactive=True)
+
+    def on_canvas_configure(self, event):
+        self.viewport.resize(event.width, event.height)
+        self.render_canvas(interactive=True)
+
 
-        #create a new image with a gray background
-        canvas_img = Image.new("RGB", (self.canvas_width, self.canvas_height), (128, 128, 128))
-        x = (self.canvas_width - img_width) // 2
-        y = (self.canvas_height - img_height) // 2
-        
-        canvas_img.paste(img_pil, (x, y))
-        self.tk_image = ImageTk.PhotoImage(canvas_img)
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
-
-        #save image position and size for cropping reference
-        self.last_canvas_offset = (x, y)
-        self.last_canvas_img_size = (img_width, img_height)
-        
     #start drawing crop rectangle
     def on_mouse_down(self, event): 
-        if self.image is None:
+        if self.state is None:
             return
         self.rect_start = (event.x, event.y)
         if self.rect_id:
@@ -204,115 +1084,347 @@ class CenteredImageEditorApp:
                 self.canvas.delete(self.rect_id)
             self.rect_id = None
 
+    @traced("crop")
     def crop_image(self):
         """Crop the image based on the recatangle selection on canvas"""
-        if self.image is not None and self.rect_start and self.rect_end:
+        if self.state is not None and self.rect_start and self.rect_end:
             x0, y0 = self.rect_start
             x1, y1 = self.rect_end
             x0, x1 = sorted([x0, x1])
             y0, y1 = sorted([y0, y1])
-            offset_x, offset_y = self.last_canvas_offset
-            img_w, img_h = self.last_canvas_img_size
-            x0_img = max(0, x0 - offset_x)
-            y0_img = max(0, y0 - offset_y)
-            x1_img = max(0, x1 - offset_x)
-            y1_img = max(0, y1 - offset_y)
-            x0_img = min(img_w, x0_img)
-            x1_img = min(img_w, x1_img)
-            y0_img = min(img_h, y0_img)
-            y1_img = min(img_h, y1_img)
-            if x1_img - x0_img > 1 and y1_img - y0_img > 1:
-                orig_h, orig_w = self.image.shape[:2]
-                scale_x = orig_w / img_w
-                scale_y = orig_h / img_h
-                img_x0 = int(x0_img * scale_x)
-                img_x1 = int(x1_img * scale_x)
-                img_y0 = int(y0_img * scale_y)
-                img_y1 = int(y1_img * scale_y)
-                img_x0, img_x1 = sorted([max(0, img_x0), min(orig_w, img_x1)])
-                img_y0, img_y1 = sorted([max(0, img_y0), min(orig_h, img_y1)])
-                cropped = self.image[img_y0:img_y1, img_x0:img_x1]
-                self.push_undo(self.resized_image if self.resized_image is not None else self.image)
-                self.cropped_image = cropped
-                self.resized_image = cropped.copy()
-                self.display_image(self.resized_image, self.cropped_panel,
-                                   text=f"Cropped ({img_x1-img_x0}x{img_y1-img_y0})")
-                self.show_on_canvas_centered(self.resized_image)
-                self.scale.set(100)
-                self.set_status(f"Cropped region: ({img_x0},{img_y0}) to ({img_x1},{img_y1})")
+            # map the selection through the viewport transform into the current state's
+            # pixels (the canvas may still show a slider preview of another size)
+            out_w, out_h = self.state.size
+            view_w, view_h = self.viewport.image_size
+            sx, sy = out_w / view_w, out_h / view_h
+            fx0, fy0 = self.viewport.canvas_to_image(x0, y0)
+            fx1, fy1 = self.viewport.canvas_to_image(x1, y1)
+            img_x0 = min(out_w, max(0, round(fx0 * sx)))
+            img_y0 = min(out_h, max(0, round(fy0 * sy)))
+            img_x1 = min(out_w, max(0, round(fx1 * sx)))
+            img_y1 = min(out_h, max(0, round(fy1 * sy)))
+            if img_x1 - img_x0 > 1 and img_y1 - img_y0 > 1:
+                self.push_undo(self.state)
+                self.state = self.state.crop((img_x0, img_y0, img_x1, img_y1))
+                self.show_on_canvas_centered(self.state,
+                                             text=f"Cropped ({img_x1-img_x0}x{img_y1-img_y0})")
+                self.reset_scale()
+                sx0, sy0, sx1, sy1 = self.state.source_box()
+                self.set_status(f"Cropped region: ({sx0},{sy0}) to ({sx1},{sy1})")
             else:
                 messagebox.showwarning("Warning", "Invalid crop selection.")
                 self.set_status("Invalid crop selection.")
 
+    def reset_scale(self):
+        """Put the slider back to 100% of the current state without triggering a resize"""
+        self.cancel_scale_jobs()
+        self.preview_active = False
+        self.committed_scale = 100
+        self.scale_base = self.state
+        self.scale.set(100)
+
+    def cancel_scale_jobs(self):
+        for job in (self.preview_job, self.commit_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.preview_job = None
+        self.commit_job = None
+
+    def on_scale_press(self, event):
+        self.slider_dragging = True
+
+    def on_scale_release(self, event):
+        self.slider_dragging = False
+        self.commit_resize()
+
+    def on_scale_change(self, value):
+        """Coalesce slider ticks into one preview per PREVIEW_DELAY_MS"""
+        if self.scale_base is None or not self.scale_base.cropped:
+            return
+        if int(value) == self.committed_scale and not self.preview_active:
+            return
+        if self.preview_job is None:
+            self.preview_job = self.root.after(PREVIEW_DELAY_MS, self.show_resize_preview)
+        if not self.slider_dragging:
+            if self.commit_job is not None:
+                self.root.after_cancel(self.commit_job)
+            self.commit_job = self.root.after(COMMIT_DELAY_MS, self.commit_resize)
+
+    @traced("resize.preview")
+    def show_resize_preview(self):
+        """Show the cropped image at the slider's size, only the visible tiles are rendered"""
+        self.preview_job = None
+        if self.scale_base is None:
+            return
+        new_size = scaled_size(*self.scale_base.size, self.scale.get())
+        self.viewport.show_state(self.scale_base.resize(new_size))
+        self.render_canvas(interactive=True)
+        self.preview_active = True
+        self.set_status(f"Preview {self.scale.get()}% ({new_size[0]}x{new_size[1]})")
+
+    def commit_resize(self):
+        """Record a single resize for the slider's final value"""
+        self.cancel_scale_jobs()
+        if self.scale_base is None or not self.scale_base.cropped:
+            return
+        value = self.scale.get()
+        if value != self.committed_scale:
+            self.resize_image(value)
+        elif self.preview_active:
+            self.show_on_canvas_centered(self.state)
+        self.preview_active = False
+
+    @traced("resize")
     def resize_image(self, value):
         """Resize the cropped image accroding to scale value"""
-        if self.cropped_image is not None:
-            scale = int(value) / 100.0
-            h, w = self.cropped_image.shape[:2]
-            new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
-            resized = cv2.resize(self.cropped_image, new_size, interpolation=cv2.INTER_AREA)
-            self.push_undo(self.resized_image if self.resized_image is not None else self.cropped_image)
-            self.resized_image = resized
-            self.display_image(resized, self.cropped_panel, text=f"Resized ({new_size[0]}x{new_size[1]})")
-            self.show_on_canvas_centered(self.resized_image)
+        if self.scale_base is not None and self.scale_base.cropped:
+            self.committed_scale = int(value)
+            new_size = scaled_size(*self.scale_base.size, int(value))
+            self.push_undo(self.state)
+            self.state = self.scale_base.resize(new_size)
+            self.show_on_canvas_centered(self.state, text=f"Resized ({new_size[0]}x{new_size[1]})")
             self.set_status(f"Resized to {new_size[0]}x{new_size[1]}")
 
-    def save_image(self):
-        """Save the currently resized (or cropped) image"""
-        if self.resized_image is None:
+    def can_save(self):
+        if self.state is None or not self.state.cropped:
             messagebox.showwarning("Warning", "No cropped or resized image to save.")
-            return
+            return False
+        if self.preview_loading:
+            messagebox.showwarning("Warning", "The full resolution image is still loading.")
+            return False
+        return True
 
-        path = filedialog.asksaveasfilename(defaultextension=".png",
+    def ask_save_path(self):
+        return filedialog.asksaveasfilename(defaultextension=".png",
                                             filetypes=[("PNG", "*.png"),
                                                        ("JPEG", "*.jpg"),
                                                        ("Bitmap", "*.bmp"),
                                                        ("TIFF", "*.tiff")])
-        if path:
-            cv2.imwrite(path, cv2.cvtColor(self.resized_image, cv2.COLOR_RGB2BGR))
-            self.set_status(f"Saved image: {os.path.basename(path)}")
 
+    def save_image(self):
+        """Save the currently resized (or cropped) image"""
+        if not self.can_save():
+            return
+        path = self.ask_save_path()
+        if not path:
+            return
+        options = self.ask_export_options(path)
+        if options is not None:
+            self.jobs.submit(f"save:{path}", self.encode_image, self.state, path, options,
+                             self.doc.path, on_done=self.on_image_saved)
+
+    def save_image_set(self):
+        """Save the cropped image at several sizes at once, e.g. full, 50% and a 256px
+        thumbnail. The file name gets _<width>x<height> added for every size."""
+        if not self.can_save():
+            return
+        sizes = simpledialog.askstring(
+            "Export Sizes", "Sizes separated by commas (50%, 256px or 800x600):",
+            initialvalue=self.export_set_sizes, parent=self.root)
+        if not sizes:
+            return
+        specs = [spec for spec in sizes.split(",") if spec.strip()]
+        try:
+            for spec in specs:
+                parse_size(spec, *self.state.size)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        self.export_set_sizes = sizes
+        path = self.ask_save_path()
+        if not path:
+            return
+        options = self.ask_export_options(path)
+        if options is not None:
+            self.jobs.submit(f"save:{path}", self.encode_image_set, self.state, path, specs,
+                             options, on_done=self.on_image_set_saved)
+
+    @traced("save_set")
+    def encode_image_set(self, job, state, path, specs, options):
+        """Worker: one resample from the original, the smaller sizes cascade from it"""
+        job.progress(0.0, f"Rendering {state.size[0]}x{state.size[1]}")
+        start = time.perf_counter()
+        img = state.materialize()
+        job.progress(0.2, f"Encoding {len(specs)} sizes")
+        files = export_set(path, img, specs, options,
+                           lambda fraction: job.progress(0.2 + 0.8 * fraction,
+                                                         f"Encoding {len(specs)} sizes"),
+                           job.check)
+        return files, time.perf_counter() - start
+
+    def on_image_set_saved(self, result):
+        files, seconds = result
+        self.history.enforce_budget()
+        self.update_memory_status()
+        total = sum(size for _, _, size in files)
+        self.set_status(f"Saved {len(files)} sizes ("
+                        + ", ".join(f"{w}x{h}" for _, (w, h), _ in files)
+                        + f"), {total / (1024 * 1024):.1f} MB in {seconds:.2f} s")
+
+    def ask_export_options(self, path):
+        """Modal dialog with the speed/size settings of the file's format, None if cancelled"""
+        fmt = export_format(path)
+        if fmt not in ("png", "jpeg", "tiff"):
+            return dict(self.export_options)
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Export {fmt.upper()}")
+        dialog.transient(self.root)
+        dialog.resizable(False, False)
+        variables = {}
+        if fmt == "png":
+            variables["png_compression"] = tk.IntVar(value=self.export_options["png_compression"])
+            Scale(dialog, from_=0, to=9, orient="horizontal", length=260,
+                  label="Compression (0 fastest, 9 smallest)",
+                  variable=variables["png_compression"]).pack(fill=tk.X, padx=10, pady=5)
+        elif fmt == "jpeg":
+            variables["jpeg_quality"] = tk.IntVar(value=self.export_options["jpeg_quality"])
+            Scale(dialog, from_=10, to=100, orient="horizontal", length=260, label="Quality",
+                  variable=variables["jpeg_quality"]).pack(fill=tk.X, padx=10, pady=5)
+            variables["jpeg_progressive"] = tk.BooleanVar(value=self.export_options["jpeg_progressive"])
+            tk.Checkbutton(dialog, text="Progressive (smaller, slower)",
+                           variable=variables["jpeg_progressive"]).pack(anchor=tk.W, padx=10)
+            variables["lossless_crop"] = tk.BooleanVar(value=self.export_options["lossless_crop"])
+            tk.Checkbutton(dialog, text="Crop a JPEG original losslessly (needs jpegtran)",
+                           variable=variables["lossless_crop"]).pack(anchor=tk.W, padx=10)
+        else:
+            variables["tiff_compression"] = tk.StringVar(value=self.export_options["tiff_compression"])
+            tk.Label(dialog, text="Compression").pack(anchor=tk.W, padx=10, pady=(5, 0))
+            tk.OptionMenu(dialog, variables["tiff_compression"],
+                          *TIFF_COMPRESSIONS).pack(fill=tk.X, padx=10)
+            tile = self.export_options["tiff_tile"]
+            variables["tiff_tile"] = tk.StringVar(value=str(tile) if tile else "strips")
+            tk.Label(dialog, text="Layout (tile size)").pack(anchor=tk.W, padx=10, pady=(5, 0))
+            tk.OptionMenu(dialog, variables["tiff_tile"],
+                          *[str(t) if t else "strips" for t in TIFF_TILE_SIZES]).pack(fill=tk.X, padx=10)
+
+        accepted = []
+        def accept(event=None):
+            accepted.append(True)
+            dialog.destroy()
+        btn_frame = tk.Frame(dialog)
+        btn_frame.pack(pady=8)
+        tk.Button(btn_frame, text="Save", command=accept).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        dialog.bind("<Return>", accept)
+        dialog.bind("<Escape>", lambda event: dialog.destroy())
+        dialog.grab_set()
+        self.root.wait_window(dialog)
+        if not accepted:
+            return None
+        for name, var in variables.items():
+            value = var.get()
+            if name == "tiff_tile":
+                value = 0 if value == "strips" else int(value)
+            self.export_options[name] = value
+        return dict(self.export_options)
+
+    @traced("save")
+    def encode_image(self, job, state, path, options, source_path=None):
+        """Worker: compute the result from the original in one resample, then stream it
+        to the file with the chosen encoder settings. A plain crop of a JPEG or TIFF
+        saved in the same format is cut from the original file instead."""
+        name = os.path.basename(path)
+        reported = [-1]
+        def progress(fraction):
+            # strips are small, only pass on whole percent steps to the UI queue
+            percent = int(fraction * 100)
+            if percent != reported[0]:
+                reported[0] = percent
+                job.progress(0.2 + 0.8 * fraction, f"Encoding {name}")
+        start = time.perf_counter()
+        box = state.crop_box()
+        if source_path and box and options.get("lossless_crop"):
+            job.progress(0.0, f"Cropping {name} from the original file")
+            result = direct_crop(source_path, path, box, options, progress, job.check)
+            if result is not None:
+                written, size = result
+                note = "" if written == box else ", widened to the JPEG block grid"
+                return path, size, 0.0, time.perf_counter() - start, f"direct crop{note}"
+        job.progress(0.0, f"Rendering {state.size[0]}x{state.size[1]}")
+        img = state.materialize()
+        rendered = time.perf_counter()
+        job.progress(0.2, f"Encoding {name}")
+        size = export_image(path, img, options, progress, job.check)
+        return path, size, rendered - start, time.perf_counter() - rendered, None
+
+    def on_image_saved(self, result):
+        path, size, render_seconds, encode_seconds, direct = result
+        self.history.enforce_budget()
+        self.update_memory_status()
+        if direct:
+            self.set_status(f"Saved image: {os.path.basename(path)} ({size / (1024 * 1024):.1f} MB), "
+                            f"{direct} in {encode_seconds:.2f} s")
+            return
+        self.set_status(f"Saved image: {os.path.basename(path)} ({size / (1024 * 1024):.1f} MB), "
+                        f"render {render_seconds:.2f} s, encode {encode_seconds:.2f} s")
+
+    def state_photo(self, state, size, thumbnail=None):
+        """PhotoImage of an edit state fitting in size, rendered once per state and then
+        taken from the panel cache (undo/redo mostly revisits rendered states).
+        thumbnail can pass the array when it was rendered ahead on a worker."""
+        key = (state.key, size)
+        img_tk = self.panel_cache.get(key)
+        if img_tk is None:
+            if thumbnail is None:
+                thumbnail = state.thumbnail(size)
+            img_tk = ImageTk.PhotoImage(pil_image(thumbnail))
+            self.tracer.count("photos")
+            self.panel_cache[key] = img_tk
+            while len(self.panel_cache) > PANEL_CACHE_SIZE:
+                self.panel_cache.popitem(last=False)
+        else:
+            self.panel_cache.move_to_end(key)
+        return img_tk
+
+    @traced("display_image")
+    def display_state(self, state, panel, text=""):
+        """Show the thumbnail of an edit state on a panel"""
+        img_tk = self.state_photo(state, PANEL_SIZE)
+        panel.config(image=img_tk, text=text)
+        panel.image = img_tk  # Keep reference
+
+    @traced("display_image")
     def display_image(self, img, panel, text=""):
         """ Conver image to a Tkinter-compatible image and display on a label"""
-        img_pil = Image.fromarray(img)
-        img_pil.thumbnail((300, 300), self.resample)
+        img_pil = pil_image(img)
+        img_pil.thumbnail((PANEL_SIZE, PANEL_SIZE), self.resample)
         img_tk = ImageTk.PhotoImage(img_pil)
+        self.tracer.count("photos")
         panel.config(image=img_tk, text=text)
         panel.image = img_tk  # Keep reference
             
-    def push_undo(self, img):
-        if img is not None:
-            self.undo_stack.append(img.copy())
-            if len(self.undo_stack) > 30:
-                self.undo_stack.pop(0)
-            self.redo_stack.clear()
+    def push_undo(self, state):
+        self.history.push(state)
+        self.update_memory_status()
 
+    @traced("undo")
     def undo(self, event=None):
         """ undo the last crop operation"""
-        if self.undo_stack:
-            if self.resized_image is not None:
-                self.redo_stack.append(self.resized_image.copy())
-            img = self.undo_stack.pop()
-            self.resized_image = img.copy()
-            self.cropped_image = img.copy()
-            self.display_image(self.resized_image, self.cropped_panel, text="Undo")
-            self.show_on_canvas_centered(self.resized_image)
-            self.scale.set(100)
+        if self.doc is None:
+            self.set_status("Nothing to undo.")
+            return
+        state = self.history.undo(self.state)
+        if state is not None:
+            self.state = state
+            self.update_memory_status()
+            self.show_on_canvas_centered(self.state, text="Undo")
+            self.reset_scale()
             self.set_status("Undo performed.")
         else:
             self.set_status("Nothing to undo.")
 
+    @traced("redo")
     def redo(self, event=None):
         """ Redo the last undone opearation"""
-        if self.redo_stack:
-            if self.resized_image is not None:
-                self.undo_stack.append(self.resized_image.copy())
-            img = self.redo_stack.pop()
-            self.resized_image = img.copy()
-            self.cropped_image = img.copy()
-            self.display_image(self.resized_image, self.cropped_panel, text="Redo")
-            self.show_on_canvas_centered(self.resized_image)
-            self.scale.set(100)
+        if self.doc is None:
+            self.set_status("Nothing to redo.")
+            return
+        state = self.history.redo(self.state)
+        if state is not None:
+            self.state = state
+            self.update_memory_status()
+            self.show_on_canvas_centered(self.state, text="Redo")
+            self.reset_scale()
             self.set_status("Redo performed.")
         else:
             self.set_status("Nothing to redo.")
@@ -333,17 +1445,76 @@ class CenteredImageEditorApp:
     def handle_save(self, event=None):
         self.save_image()
 
+    # Shortcut handlers for closing and switching between open images
+    def handle_close(self, event=None):
+        self.close_document()
+
+    def handle_next_document(self, event=None):
+        if self.session is not None:
+            self.switch_document(self.session.neighbour(1))
+        return "break"
+
+    def handle_previous_document(self, event=None):
+        if self.session is not None:
+            self.switch_document(self.session.neighbour(-1))
+        return "break"
+
+    # Shortcut handlers for browsing the folder of the current image
+    def handle_next_file(self, event=None):
+        self.browse(1)
+        return "break"
+
+    def handle_previous_file(self, event=None):
+        self.browse(-1)
+        return "break"
+
+    # Shortcut handler for exporting the operation trace
+    def handle_export_trace(self, event=None):
+        self.export_trace()
+
+    # Shortcut handler for cancelling running background jobs
+    def handle_cancel(self, event=None):
+        if self.jobs.active:
+            # the full resolution decode behind a preview is needed to leave preview mode
+            self.jobs.cancel_all(keep=("load_full",))
+            self.set_status("Cancelled.")
+
+    def on_close(self):
+        self.jobs.shutdown()
+        if self.session is not None:
+            self.session.close_all()
+        self.root.destroy()
+
+    # Shortcut handlers for zooming the canvas
+    def handle_zoom_in(self, event=None):
+        self.zoom_canvas(ZOOM_STEP)
+
+    def handle_zoom_out(self, event=None):
+        self.zoom_canvas(1 / ZOOM_STEP)
+
+    def handle_zoom_fit(self, event=None):
+        if self.viewport.pyramid is not None:
+            self.viewport.fit()
+            self.render_canvas()
+            self.set_status("Zoom: fit to window")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop and resize images.")
+    parser.add_argument("image", nargs="?", help="image file to open")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the time to the first window, to the loaded imaging "
+                             "stack and to the first image (with an image given), then quit")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record the memory allocated by every operation in the trace "
+                             "(tracemalloc, slows the editor down)")
+    args = parser.parse_args()
     try:
         root = tk.Tk()
-        app = CenteredImageEditorApp(root)
+        app = CenteredImageEditorApp(root, args.profile_startup, args.trace_memory)
+        if args.image:
+            app.open_path(args.image)
         root.mainloop()
     except ImportError as e:
-        messagebox.showerror(
-            "Dependency Error",
-            "A required library is missing:\n\n{}\n\n"
-            "Install missing dependencies with:\n"
-            "pip install pillow opencv-python numpy".format(e)
-        )
+        show_dependency_error(e)
     except Exception as ex:
         messagebox.showerror("Error", str(ex))
@@ -0,0 +1,194 @@
+"""Apply the image editor's crop and resize to many files at once, without a window.
+
+Examples:
+    python batch_edit.py scans -o out --crop 100,100,900,700 --scale 50
+    python batch_edit.py "scans/*.tif" -o out --recipe recipe.json --workers 8
+
+A recipe is a JSON file with any of the keys
+    {"crop": [x0, y0, x1, y1], "scale": 50, "format": "png", "suffix": "_small",
+     "export": {"png_compression": 3, "jpeg_quality": 85}}
+command line options override the recipe, "export" takes the encoder settings of
+exporter.EXPORT_DEFAULTS. A crop without resize of JPEG or TIFF files kept in their
+format is cut straight from the file (see direct_crop.py), unless "lossless_crop" is
+false in "export". JPEGs cut that way start on the 8 or 16 pixel block grid, the box
+actually written is printed when it differs from the crop asked for.
+
+Results never replace their input files unless --overwrite is given, each one is then
+written next to the input first and only moved over it once complete."""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+import cv2
+from editor_core import IMAGE_EXTENSIONS, read_image, crop_region, resize_array, scaled_size
+from exporter import export_image
+from direct_crop import direct_crop
+
+
+def find_images(source):
+    """Image files in a directory, or matching a glob pattern"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths
+                  if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def build_recipe(args):
+    """Recipe from the --recipe file with the command line options applied on top"""
+    recipe = {}
+    if args.recipe:
+        with open(args.recipe) as f:
+            recipe = json.load(f)
+    if args.crop:
+        recipe["crop"] = [int(v) for v in args.crop.split(",")]
+    if args.scale is not None:
+        recipe["scale"] = args.scale
+    if args.format:
+        recipe["format"] = args.format
+    if args.suffix is not None:
+        recipe["suffix"] = args.suffix
+    if "crop" in recipe and len(recipe["crop"]) != 4:
+        raise ValueError("crop needs four values: x0,y0,x1,y1")
+    if recipe.get("scale", 100) <= 0:
+        raise ValueError("scale must be a positive percentage")
+    return recipe
+
+
+def positive_percent(text):
+    """argparse type of --scale"""
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive percentage")
+    return value
+
+
+def apply_recipe(img, recipe):
+    """Crop, then resize, exactly like the editor does"""
+    if recipe.get("crop"):
+        img = crop_region(img, recipe["crop"])
+    scale = recipe.get("scale", 100)
+    if scale != 100:
+        h, w = img.shape[:2]
+        img = resize_array(img, scaled_size(w, h, scale))
+    return img
+
+
+def output_path(path, out_dir, recipe):
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if recipe.get("format"):
+        ext = "." + recipe["format"].lstrip(".")
+    return os.path.join(out_dir, stem + recipe.get("suffix", "") + ext)
+
+
+def same_file(left, right):
+    return os.path.normcase(os.path.abspath(left)) == os.path.normcase(os.path.abspath(right))
+
+
+def init_worker():
+    # one OpenCV thread per process, the pool already keeps every core busy
+    cv2.setNumThreads(1)
+
+
+def process_file(task):
+    """Pool worker: run the recipe on one file, only small stats go back to the parent"""
+    path, out_dir, recipe = task
+    start = time.perf_counter()
+    target = None
+    try:
+        size = os.path.getsize(path)
+        out = output_path(path, out_dir, recipe)
+        # replacing the input (--overwrite): a failed write must not take the original along
+        root, ext = os.path.splitext(out)
+        target = root + ".partial" + ext if same_file(out, path) else out
+        options = recipe.get("export") or {}
+        result = {"path": path, "ok": True, "bytes": size, "output": out}
+        written = None
+        if (recipe.get("crop") and recipe.get("scale", 100) == 100
+                and options.get("lossless_crop", True)):
+            # a plain crop of a JPEG or TIFF, cut from the file without decoding it all
+            written = direct_crop(path, target, recipe["crop"], options)
+        if written is not None:
+            if list(written[0]) != list(recipe["crop"]):
+                result["box"] = list(written[0])
+        else:
+            img = read_image(path)
+            if img is None:
+                raise ValueError("could not decode image")
+            export_image(target, apply_recipe(img, recipe), options)
+        if target != out:
+            os.replace(target, out)
+        result["seconds"] = time.perf_counter() - start
+        return result
+    except Exception as e:
+        if target and target != out and os.path.exists(target):
+            os.remove(target)
+        return {"path": path, "ok": False, "bytes": 0, "error": str(e),
+                "seconds": time.perf_counter() - start}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch crop/resize images with a process pool.")
+    parser.add_argument("input", help="directory or glob pattern of images")
+    parser.add_argument("-o", "--output", required=True, help="directory for the results")
+    parser.add_argument("--recipe", help="JSON recipe file")
+    parser.add_argument("--crop", help="crop box in pixels: x0,y0,x1,y1")
+    parser.add_argument("--scale", type=positive_percent, help="resize percentage, like the editor slider")
+    parser.add_argument("--format", help="output format/extension, default keeps the input one")
+    parser.add_argument("--suffix", help="text added to output file names")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="allow results to replace their input files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--max-tasks", type=int, default=50,
+                        help="files per worker process before it is replaced, bounds memory growth")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = build_recipe(args)
+    except (OSError, ValueError) as e:
+        print(f"Invalid recipe: {e}", file=sys.stderr)
+        return 2
+    files = find_images(args.input)
+    if not files:
+        print(f"No images found in {args.input}", file=sys.stderr)
+        return 2
+    replaced = [path for path in files if same_file(output_path(path, args.output, recipe), path)]
+    if replaced and not args.overwrite:
+        print(f"{len(replaced)} results would replace their input files (like {replaced[0]}), "
+              "use another output directory, a --suffix or --overwrite", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    # each worker holds a single image at a time and sends back only stats, so memory
+    # stays bounded by workers x one image no matter how many files there are
+    tasks = ((path, args.output, recipe) for path in files)
+    done = failed = total_bytes = 0
+    start = time.perf_counter()
+    with Pool(args.workers, initializer=init_worker, maxtasksperchild=args.max_tasks) as pool:
+        for result in pool.imap_unordered(process_file, tasks):
+            if result["ok"]:
+                done += 1
+                total_bytes += result["bytes"]
+                box = result.get("box")
+                cut = f", cut {','.join(map(str, box))}" if box else ""
+                print(f"ok    {result['path']} -> {result['output']} "
+                      f"({result['seconds']:.2f} s{cut})")
+            else:
+                failed += 1
+                print(f"FAIL  {result['path']}: {result['error']}", file=sys.stderr)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(f"\n{done} of {len(files)} images processed, {failed} failed, in {elapsed:.2f} s")
+    print(f"Throughput: {done / elapsed:.1f} images/s, "
+          f"{total_bytes / (1024 * 1024) / elapsed:.1f} MB/s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
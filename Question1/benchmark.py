@@ -0,0 +1,199 @@
+"""Headless benchmark of the image editor's hot paths on synthetic images.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --sizes 1,12,50,200 --repeat 5 -o results.json
+    python benchmark.py --sizes 12 --compare results.json
+
+Every operation is timed --repeat times per image size. The report has latency
+percentiles and the peak memory the operation allocated (numpy/OpenCV arrays, from
+tracemalloc). --output writes the results as JSON, --compare prints the change against
+an earlier JSON file."""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from editor_core import (EditHistory, EditState, ImagePyramid, read_image, write_image,
+                         pil_image, crop_region, resize_array, scaled_size)
+from exporter import export_image, export_set
+
+DEFAULT_SIZES = "1,12,50"
+PERCENTILES = (50, 90, 99)
+
+
+def synthetic_image(megapixels, seed=0):
+    """4:3 BGR test image with gradients, edges and noise, so codecs and resamplers get
+    realistic work instead of flat color"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = x
+    img[..., 1] = y
+    img[..., 2] = (x + y) / 2
+    img[::64] = 0
+    img[:, ::64] = 255
+    # noise on a small tile repeated over the image, random numbers for 200 MP are slow
+    noise = rng.integers(0, 32, (256, 256, 3), dtype=np.uint8)
+    reps = (height // 256 + 1, width // 256 + 1, 1)
+    img += np.tile(noise, reps)[:height, :width]
+    return img
+
+
+def measure(func, repeat):
+    """Run func repeat times, return (seconds per run, peak traced bytes)"""
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return times, peak
+
+
+def summarize(times, peak):
+    ms = np.array(times) * 1000
+    result = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    result.update({"min_ms": round(float(ms.min()), 3), "max_ms": round(float(ms.max()), 3),
+                   "runs": len(times), "peak_mb": round(peak / (1024 * 1024), 2)})
+    return result
+
+
+def operations(img, tmp_dir):
+    """(name, callable) pairs for the editor's hot paths on one image"""
+    h, w = img.shape[:2]
+    png_path = os.path.join(tmp_dir, "in.png")
+    jpg_path = os.path.join(tmp_dir, "in.jpg")
+    cv2.imwrite(png_path, img)
+    cv2.imwrite(jpg_path, img)
+    box = (w // 8, h // 8, w - w // 8, h - h // 8)
+    crop = crop_region(img, box)
+    pyramid = ImagePyramid(img)
+    state = EditState(pyramid).crop(box).resize(scaled_size(*crop.shape[1::-1], 50))
+
+    def undo_redo():
+        history = EditHistory()
+        current = EditState(pyramid)
+        for i in range(10):
+            history.push(current)
+            current = current.crop((1, 1, current.size[0] - 1, current.size[1] - 1))
+        for _ in range(10):
+            current = history.undo(current)
+        for _ in range(10):
+            current = history.redo(current)
+        history.clear()
+
+    return [
+        ("load_jpeg", lambda: read_image(jpg_path)),
+        ("load_png", lambda: read_image(png_path)),
+        ("display_tile", lambda: pil_image(state.thumbnail(1024))),
+        ("crop", lambda: np.ascontiguousarray(crop_region(img, box))),
+        ("resize_50", lambda: resize_array(crop, scaled_size(*crop.shape[1::-1], 50))),
+        ("resize_150", lambda: resize_array(crop, scaled_size(*crop.shape[1::-1], 150))),
+        ("resize_50_single", lambda: cv2.resize(crop, scaled_size(*crop.shape[1::-1], 50),
+                                                interpolation=cv2.INTER_AREA)),
+        ("resize_150_single", lambda: cv2.resize(crop, scaled_size(*crop.shape[1::-1], 150),
+                                                 interpolation=cv2.INTER_AREA)),
+        ("pyramid", lambda: ImagePyramid(img)),
+        ("thumbnail_300", lambda: state.thumbnail(300)),
+        ("view_draft", lambda: state.thumbnail(1600, "draft")),
+        ("view_balanced", lambda: state.thumbnail(1600, "balanced")),
+        ("view_high", lambda: state.thumbnail(1600, "high")),
+        ("undo_redo_10", undo_redo),
+        ("render_edit", lambda: EditState(pyramid, state.ops).materialize()),
+        ("save_jpeg", lambda: write_image(os.path.join(tmp_dir, "out.jpg"), img)),
+        ("save_png", lambda: write_image(os.path.join(tmp_dir, "out.png"), img)),
+        ("export_png_1", lambda: export_image(os.path.join(tmp_dir, "out.png"), img,
+                                              {"png_compression": 1})),
+        ("export_png_6", lambda: export_image(os.path.join(tmp_dir, "out.png"), img)),
+        ("export_jpeg_90", lambda: export_image(os.path.join(tmp_dir, "out.jpg"), img)),
+        ("export_tiff", lambda: export_image(os.path.join(tmp_dir, "out.tif"), img)),
+        ("export_set_3", lambda: export_set(os.path.join(tmp_dir, "set.jpg"), img,
+                                            ["100%", "50%", "256px"])),
+    ]
+
+
+def peak_rss_mb():
+    """Peak resident memory of the whole process, None where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compare(results, baseline_path):
+    """Print p50 of every operation next to the same one in an earlier run"""
+    with open(baseline_path) as f:
+        baseline = {(r["megapixels"], r["operation"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (p50, negative is faster):")
+    for r in results:
+        old = baseline.get((r["megapixels"], r["operation"]))
+        if old and old["p50_ms"] > 0:
+            change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            print(f"  {r['megapixels']:>6g} MP  {r['operation']:<17} "
+                  f"{old['p50_ms']:>10.2f} -> {r['p50_ms']:>10.2f} ms  {change:+6.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the editor core without a display.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma separated image sizes in megapixels (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per operation and size")
+    parser.add_argument("--only", help="comma separated operation names to run")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [float(v) for v in args.sizes.split(",")]
+    except ValueError:
+        print(f"Invalid --sizes: {args.sizes}", file=sys.stderr)
+        return 2
+    only = set(args.only.split(",")) if args.only else None
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="editor-bench-") as tmp_dir:
+        for megapixels in sizes:
+            img = synthetic_image(megapixels)
+            print(f"{megapixels:g} MP ({img.shape[1]}x{img.shape[0]})")
+            for name, func in operations(img, tmp_dir):
+                if only and name not in only:
+                    continue
+                func()  # warm up caches and OpenCV's thread pool
+                stats = summarize(*measure(func, args.repeat))
+                results.append({"megapixels": megapixels, "operation": name, **stats})
+                print(f"  {name:<17} p50 {stats['p50_ms']:>10.2f} ms  p90 {stats['p90_ms']:>10.2f} ms"
+                      f"  p99 {stats['p99_ms']:>10.2f} ms  peak {stats['peak_mb']:>8.1f} MB")
+            del img
+
+    report = {"python": platform.python_version(), "numpy": np.__version__,
+              "opencv": cv2.__version__, "platform": platform.platform(),
+              "cpus": os.cpu_count(), "repeat": args.repeat,
+              "peak_rss_mb": peak_rss_mb(), "results": results}
+    print(f"\nPeak process memory: {report['peak_rss_mb']} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Crop straight from the original file, without decoding and re-encoding all of it.
+
+JPEGs are cropped losslessly in the DCT domain by jpegtran (libjpeg / libjpeg-turbo),
+when it is installed. The compressed blocks are copied unchanged, so there is no
+generation loss, but the left and top edge have to fall on the MCU grid (8 or 16
+pixels): the box is widened to the grid line before it.
+
+Baseline TIFFs in strips or tiles (like the ones exporter.py writes) are read block by
+block and only the blocks that touch the box are decoded, then the region is written
+with the normal exporter settings.
+
+direct_crop() returns None whenever the file can't take the direct path (other formats,
+EXIF rotation, compressions we don't read, no jpegtran), the caller then falls back to
+a full decode."""
+
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+import numpy as np
+from editor_core import clamp_box
+from exporter import export_format, export_image
+
+JPEGTRAN = shutil.which("jpegtran")
+# TIFF compressions read_tiff_region understands: none, deflate and old style deflate
+TIFF_READ_COMPRESSIONS = (1, 8, 32946)
+TIFF_TYPES = {1: "B", 3: "H", 4: "I", 16: "Q"}
+
+
+def jpeg_info(path):
+    """(width, height, MCU width, MCU height, EXIF orientation) from the JPEG headers,
+    None if the file is not a JPEG"""
+    orientation = 1
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            kind = marker[1]
+            if kind == 0xFF:
+                f.seek(-1, os.SEEK_CUR)  # fill byte
+                continue
+            length = struct.unpack(">H", f.read(2))[0]
+            data = f.read(length - 2)
+            if kind == 0xE1 and data.startswith(b"Exif\x00\x00"):
+                orientation = exif_orientation(data[6:])
+            elif kind in (0xC0, 0xC1, 0xC2):
+                height, width, components = struct.unpack(">HHB", data[1:6])
+                factors = [data[7 + 3 * i] for i in range(components)]
+                mcu_w = 8 * max(v >> 4 for v in factors)
+                mcu_h = 8 * max(v & 15 for v in factors)
+                return width, height, mcu_w, mcu_h, orientation
+            elif kind == 0xDA:
+                return None
+
+
+def exif_orientation(tiff):
+    """Orientation tag of an EXIF block (a small TIFF file), 1 if it has none"""
+    try:
+        order = "<" if tiff[:2] == b"II" else ">"
+        ifd = struct.unpack(order + "I", tiff[4:8])[0]
+        count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+        for i in range(count):
+            entry = tiff[ifd + 2 + 12 * i:ifd + 14 + 12 * i]
+            if struct.unpack(order + "H", entry[:2])[0] == 274:
+                return struct.unpack(order + "H", entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def crop_jpeg(src, dst, box):
+    """Lossless jpegtran crop, returns the box actually cut (widened to the MCU grid at
+    the left and top) or None if that's not possible for this file"""
+    info = jpeg_info(src)
+    if JPEGTRAN is None or info is None:
+        return None
+    width, height, mcu_w, mcu_h, orientation = info
+    if orientation != 1:
+        # the editor shows the rotated image, jpegtran would cut the stored one
+        return None
+    x0, y0, x1, y1 = clamp_box(box, width, height)
+    x0, y0 = x0 - x0 % mcu_w, y0 - y0 % mcu_h
+    command = [JPEGTRAN, "-copy", "all", "-crop", f"{x1 - x0}x{y1 - y0}+{x0}+{y0}",
+               "-outfile", dst, src]
+    try:
+        result = subprocess.run(command, capture_output=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return None
+    return x0, y0, x1, y1
+
+
+def tiff_info(path):
+    """Layout of the first image of a TIFF file as a dict, None if it is not an 8 bit
+    RGB (or gray) image that read_tiff_region can decode"""
+    with open(path, "rb") as f:
+        header = f.read(8)
+        if header[:4] not in (b"II*\x00", b"MM\x00*"):
+            return None
+        order = "<" if header[:2] == b"II" else ">"
+        f.seek(struct.unpack(order + "I", header[4:])[0])
+        count = struct.unpack(order + "H", f.read(2))[0]
+        entries = [struct.unpack(order + "HHI4s", f.read(12)) for _ in range(count)]
+        tags = {}
+        for tag, kind, n, raw in entries:
+            if kind not in TIFF_TYPES:
+                continue
+            fmt = f"{order}{n}{TIFF_TYPES[kind]}"
+            size = struct.calcsize(fmt)
+            if size <= 4:
+                data = raw[:size]
+            else:
+                f.seek(struct.unpack(order + "I", raw)[0])
+                data = f.read(size)
+            tags[tag] = struct.unpack(fmt, data)
+    samples = tags.get(277, (1,))[0]
+    info = {
+        "order": order,
+        "width": tags[256][0], "height": tags[257][0], "samples": samples,
+        "compression": tags.get(259, (1,))[0], "predictor": tags.get(317, (1,))[0],
+    }
+    if (samples not in (1, 3) or set(tags.get(258, (8,))) != {8}
+            or tags.get(284, (1,))[0] != 1 or tags.get(274, (1,))[0] != 1
+            or tags.get(262, (2,))[0] not in (1, 2)
+            or info["compression"] not in TIFF_READ_COMPRESSIONS
+            or info["predictor"] not in (1, 2)):
+        return None
+    if 322 in tags:
+        info.update(tile_w=tags[322][0], tile_h=tags[323][0],
+                    offsets=tags[324], counts=tags[325])
+    elif 273 in tags:
+        rows = tags.get(278, (info["height"],))[0]
+        info.update(tile_w=info["width"], tile_h=min(rows, info["height"]),
+                    offsets=tags[273], counts=tags[279])
+    else:
+        return None
+    return info
+
+
+def read_tiff_region(path, box, info=None, check=None):
+    """BGR pixels of box (x0, y0, x1, y1) from a strip or tile TIFF, decoding only the
+    blocks that overlap it"""
+    info = info or tiff_info(path)
+    x0, y0, x1, y1 = box
+    tile_w, tile_h, samples = info["tile_w"], info["tile_h"], info["samples"]
+    across = -(-info["width"] // tile_w)
+    region = np.empty((y1 - y0, x1 - x0, samples), dtype=np.uint8)
+    with open(path, "rb") as f:
+        for row in range(y0 // tile_h, -(-y1 // tile_h)):
+            for col in range(x0 // tile_w, -(-x1 // tile_w)):
+                if check:
+                    check()
+                index = row * across + col
+                f.seek(info["offsets"][index])
+                data = f.read(info["counts"][index])
+                if info["compression"] != 1:
+                    data = zlib.decompress(data)
+                # strips hold as many rows as they have, tiles are always full size
+                block = np.frombuffer(data, dtype=np.uint8)
+                block = block[:len(block) - len(block) % (tile_w * samples)]
+                block = block.reshape(-1, tile_w, samples)
+                if info["predictor"] == 2:
+                    block = np.cumsum(block, axis=1, dtype=np.uint8)
+                bx0, by0 = col * tile_w, row * tile_h
+                cx0, cy0 = max(x0, bx0), max(y0, by0)
+                cx1 = min(x1, bx0 + tile_w)
+                cy1 = min(y1, by0 + tile_h, by0 + block.shape[0])
+                region[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = \
+                    block[cy0 - by0:cy1 - by0, cx0 - bx0:cx1 - bx0]
+    if samples == 1:
+        return np.repeat(region, 3, axis=2)
+    return region[..., ::-1]
+
+
+def direct_crop(src, dst, box, options=None, progress=None, check=None):
+    """Write box (x0, y0, x1, y1, whole source pixels) of the file src to dst without a
+    full decode. The box is clamped like crop_region() does. Returns (box actually
+    written, file size) or None when src and dst can't take the direct path, nothing is
+    written then."""
+    fmt = export_format(src)
+    if fmt != export_format(dst):
+        return None
+    if fmt == "jpeg":
+        written = crop_jpeg(src, dst, box)
+        if written is None:
+            return None
+        if progress:
+            progress(1.0)
+        return written, os.path.getsize(dst)
+    if fmt == "tiff":
+        try:
+            info = tiff_info(src)
+        except (OSError, KeyError, struct.error):
+            return None
+        if info is None:
+            return None
+        box = clamp_box(box, info["width"], info["height"])
+        region = read_tiff_region(src, box, info, check)
+        return box, export_image(dst, region, options, progress, check)
+    return None
@@ -0,0 +1,718 @@
+"""Pixel operations of the image editor without any Tk dependency.
+Shared by the editor window and the batch command line tool."""
+
+import os
+import math
+import time
+import zlib
+import queue
+import itertools
+from collections import deque
+import atexit
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import cv2
+import numpy as np
+
+# Side length in pixels of the square tiles the canvas is drawn with
+TILE_SIZE = 256
+# Memory the undo/redo history may keep in RAM before older states are spilled to disk
+HISTORY_BUDGET_MB = 512
+# Hard cap on the number of undo steps, bounds the size of the on-disk spill cache
+HISTORY_MAX_ENTRIES = 200
+# zlib level used for spilled states, 1 is fast and still shrinks photos noticeably
+SPILL_COMPRESSION = 1
+# Latest restore timings kept for the history stats
+HISTORY_RESTORE_TIMES = 1000
+# Memory all open documents may use together, least recently used ones are shrunk first
+SESSION_BUDGET_MB = 1024
+# Longest side of the preview an inactive document keeps when it is shrunk
+SESSION_PREVIEW_SIZE = 1024
+
+# Resampling quality tiers: name -> (level bias, filter when shrinking, filter when
+# enlarging). The bias moves from the pyramid level with one pixel per output pixel to a
+# coarser (positive) or finer (negative) one, so large downscales always start from the
+# pyramid and the filter only covers the last factor of 2 (draft) up to 4 (high).
+QUALITY_TIERS = {
+    "draft": (0, cv2.INTER_LINEAR, cv2.INTER_NEAREST),
+    "balanced": (0, cv2.INTER_AREA, cv2.INTER_LINEAR),
+    "high": (-1, cv2.INTER_AREA, cv2.INTER_CUBIC),
+}
+
+# Full resolution resizes of at least this many output pixels run in horizontal bands
+# of about RESIZE_BAND_ROWS output rows, RESIZE_WORKERS bands at a time
+RESIZE_BANDED_MIN_PIXELS = 8 * 1024 * 1024
+RESIZE_BAND_ROWS = 512
+RESIZE_WORKERS = min(4, os.cpu_count() or 1)
+
+# File types the editor and the batch tool open
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# Huge scans are exactly what the editor is for, so lift Pillow's decompression bomb limit
+Image.MAX_IMAGE_PIXELS = None
+
+# Every pyramid gets a new version number, render caches use it to tell images apart
+_pyramid_versions = itertools.count(1)
+
+
+def read_image(path, flag=cv2.IMREAD_COLOR):
+    """Decode an image file into a read-only BGR array, None if it can't be read.
+    Pixels stay in OpenCV's BGR order everywhere, only displayed tiles are swapped."""
+    img = cv2.imread(path, flag)
+    if img is None:
+        return None
+    return freeze(img)
+
+
+def folder_images(folder):
+    """Image files of a folder sorted by name, the order next/previous browse in"""
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    paths = [os.path.join(folder, name) for name in sorted(names, key=str.lower)
+             if name.lower().endswith(IMAGE_EXTENSIONS)]
+    return [p for p in paths if os.path.isfile(p)]
+
+
+def write_image(path, img):
+    """Encode a BGR array to path, the format follows the file extension"""
+    if not cv2.imwrite(path, img):
+        raise ValueError(f"Failed to save {os.path.basename(path)}")
+
+
+def pil_image(img):
+    """PIL image of a BGR array for display. Pillow swaps the channels while it copies
+    the buffer in, so there is no extra conversion copy of the (small) displayed array."""
+    img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    return Image.frombuffer("RGB", (w, h), img, "raw", "BGR", img.strides[0], 1)
+
+
+def clamp_box(box, width, height):
+    """Box (x0, y0, x1, y1) ordered and clamped to a width x height image"""
+    x0, y0, x1, y1 = box
+    x0, x1 = sorted([min(width, max(0, x0)), min(width, max(0, x1))])
+    y0, y1 = sorted([min(height, max(0, y0)), min(height, max(0, y1))])
+    if x1 - x0 < 1 or y1 - y0 < 1:
+        raise ValueError(f"Crop box {tuple(box)} is outside the {width}x{height} image")
+    return x0, y0, x1, y1
+
+
+def crop_region(img, box):
+    """View of img inside box (x0, y0, x1, y1), clamped to the image, no pixels are copied"""
+    x0, y0, x1, y1 = clamp_box(box, img.shape[1], img.shape[0])
+    return img[y0:y1, x0:x1]
+
+
+def scaled_size(width, height, percent):
+    """Size of a width x height image resized to percent, at least one pixel"""
+    scale = percent / 100.0
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+
+def resize_array(img, size):
+    """Full quality resize of img to size (width, height)"""
+    return resize_banded(img, size, cv2.INTER_AREA)
+
+
+def resize_bands(height, out_height, rows=RESIZE_BAND_ROWS):
+    """Output row ranges for resize_banded, [] when height can't be split exactly.
+    A band may only start on an output row that maps to a whole source row, these come
+    every out_height / gcd rows, so the bands resample exactly like one big resize."""
+    period = out_height // math.gcd(height, out_height)
+    rows = max(period, rows // period * period)
+    if rows >= out_height:
+        return []
+    return [(y0, min(out_height, y0 + rows)) for y0 in range(0, out_height, rows)]
+
+
+def resize_banded(img, size, interpolation=cv2.INTER_AREA, workers=RESIZE_WORKERS):
+    """cv2.resize of a large image as horizontal bands resized on a thread pool (OpenCV
+    releases the GIL) straight into one preallocated output. The result is the same as
+    a single cv2.resize. Small images, sizes that don't split exactly and single core
+    machines take one call."""
+    height = img.shape[0]
+    out_w, out_h = size
+    bands = []
+    if workers > 1 and out_w * out_h >= RESIZE_BANDED_MIN_PIXELS:
+        bands = resize_bands(height, out_h)
+    if not bands:
+        return cv2.resize(img, size, interpolation=interpolation)
+    out = np.empty((out_h, out_w) + img.shape[2:], dtype=img.dtype)
+    src_rows = height // math.gcd(height, out_h)  # source rows of one alignment period
+    out_rows = out_h // math.gcd(height, out_h)
+    # filters other than a shrinking INTER_AREA read a few rows past their own interval,
+    # each band gets whole periods of context above and below that are thrown away
+    shrinking = out_h < height and out_w < img.shape[1]
+    margin = 0 if interpolation == cv2.INTER_AREA and shrinking else -(-4 // src_rows) * src_rows
+
+    def band(rows):
+        y0, y1 = rows
+        s0 = y0 // out_rows * src_rows
+        s1 = y1 // out_rows * src_rows if y1 < out_h else height
+        w0, w1 = max(0, s0 - margin), min(height, s1 + margin)
+        window_size = (out_w, (w1 - w0) // src_rows * out_rows)
+        if not margin:
+            cv2.resize(img[w0:w1], window_size, dst=out[y0:y1], interpolation=interpolation)
+            return
+        top = (s0 - w0) // src_rows * out_rows
+        out[y0:y1] = cv2.resize(img[w0:w1], window_size, interpolation=interpolation)[top:top + y1 - y0]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(band, bands))
+    return out
+
+
+def buffer_root(img):
+    """Follow the chain of numpy views back to the array that owns the memory"""
+    while isinstance(img.base, np.ndarray):
+        img = img.base
+    return img
+
+
+def freeze(img):
+    """Mark an image read-only so it can be shared between history entries without copying"""
+    img.flags.writeable = False
+    return img
+
+
+class HistoryEntry:
+    """One history state, its cached pixels can be spilled to a compressed temp file"""
+    def __init__(self, state):
+        self.state = state
+        self.shape = None
+        self.dtype = None
+        self.path = None  # spill file, kept after a restore so spilling again is free
+        self.disk_bytes = 0
+        self.queued = False
+        self.discarded = False
+        self.lock = threading.Lock()
+
+
+class EditHistory:
+    """Undo/redo stacks of EditStates. A state is only a list of operations on a shared
+    source image, so an entry costs next to nothing until its result is materialized
+    (for example on export). When the pixels held by the history exceed the memory
+    budget, the cached results of the oldest states are compressed to a temporary
+    directory by a background thread and read back on undo/redo."""
+    def __init__(self, budget_bytes=HISTORY_BUDGET_MB * 1024 * 1024,
+                 max_entries=HISTORY_MAX_ENTRIES):
+        self.budget_bytes = budget_bytes
+        self.max_entries = max_entries
+        self.undo_stack = []
+        self.redo_stack = []
+        self.spill_dir = None
+        self.spill_queue = queue.Queue()
+        self.spill_thread = None
+        self.current = None  # entry of the state undo/redo returned last
+        self.hits = 0
+        self.misses = 0
+        self.restore_times = deque(maxlen=HISTORY_RESTORE_TIMES)
+
+    def entry_for(self, state):
+        """The entry undo/redo restored state from when it is still the current one, so
+        it goes back on a stack with its spill file, else a new entry"""
+        entry, self.current = self.current, None
+        if entry is not None:
+            if entry.state is state:
+                return entry
+            self.discard(entry)
+        return HistoryEntry(state)
+
+    def push(self, state):
+        """Record the state before an edit, a new edit invalidates the redo stack"""
+        if state is not None:
+            self.undo_stack.append(self.entry_for(state))
+            while len(self.undo_stack) > self.max_entries:
+                self.discard(self.undo_stack.pop(0))
+            for entry in self.redo_stack:
+                self.discard(entry)
+            self.redo_stack.clear()
+            self.enforce_budget()
+
+    def undo(self, current):
+        """Return the previous state (or None) and remember current for redo"""
+        if not self.undo_stack:
+            return None
+        if current is not None:
+            self.redo_stack.append(self.entry_for(current))
+        state = self.restore(self.undo_stack.pop())
+        self.enforce_budget()
+        return state
+
+    def redo(self, current):
+        """Return the next state (or None) and remember current for undo"""
+        if not self.redo_stack:
+            return None
+        if current is not None:
+            self.undo_stack.append(self.entry_for(current))
+        state = self.restore(self.redo_stack.pop())
+        self.enforce_budget()
+        return state
+
+    def remap(self, func):
+        """Replace every state by func(state), used to swap the source of the edits.
+        func only gets the operations, cached pixels of spilled states are not read back."""
+        for stack in (self.undo_stack, self.redo_stack):
+            for i, entry in enumerate(stack):
+                state = func(entry.state)
+                self.discard(entry)
+                stack[i] = HistoryEntry(state)
+        self.entry_for(None)
+        self.enforce_budget()
+
+    def clear(self):
+        self.entry_for(None)
+        for entry in self.undo_stack + self.redo_stack:
+            self.discard(entry)
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def close(self):
+        """Drop every entry and stop the spill thread, which removes its directory"""
+        self.clear()
+        if self.spill_thread is not None:
+            self.spill_queue.put(None)
+            self.spill_queue = queue.Queue()
+            self.spill_thread = None
+            self.spill_dir = None
+
+    def restore(self, entry):
+        """Get an entry's state, reading its cached pixels back from disk if spilled.
+        The entry becomes the current one and keeps its spill file."""
+        self.current = entry
+        with entry.lock:
+            entry.queued = False
+            state = entry.state
+            if state.pixels is not None:
+                self.hits += 1
+                return state
+            if entry.path is None:
+                return state  # never rendered, nothing was cached
+            start = time.perf_counter()
+            with open(entry.path, "rb") as f:
+                data = zlib.decompress(f.read())
+            state.pixels = freeze(np.frombuffer(data, dtype=entry.dtype).reshape(entry.shape))
+            self.restore_times.append(time.perf_counter() - start)
+            self.misses += 1
+            return state
+
+    def discard(self, entry):
+        with entry.lock:
+            entry.queued = False
+            entry.discarded = True
+            if entry.path:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                entry.path = None
+
+    def entries(self):
+        return self.undo_stack + self.redo_stack
+
+    def memory_bytes(self):
+        """Bytes of the distinct buffers kept in RAM by the history, shared buffers count once"""
+        roots = {}
+        for entry in self.entries():
+            for img in entry.state.buffers():
+                root = buffer_root(img)
+                roots[id(root)] = root.nbytes
+        return sum(roots.values())
+
+    def disk_bytes(self):
+        entries = self.entries() + ([self.current] if self.current else [])
+        return sum(e.disk_bytes for e in entries if e.path)
+
+    def enforce_budget(self):
+        """Queue the cached results furthest from the current state for spilling until
+        the history fits the budget again, source images are shared and never spilled"""
+        roots = {}
+        for entry in self.entries():
+            for img in entry.state.buffers():
+                root = buffer_root(img)
+                roots.setdefault(id(root), [root.nbytes, set()])[1].add(id(entry))
+        total = sum(size for size, _ in roots.values())
+        # oldest undo states first, then the far end of the redo stack
+        for entry in self.entries():
+            if total <= self.budget_bytes:
+                break
+            pixels = entry.state.pixels
+            if pixels is None or entry.queued:
+                continue
+            entry.queued = True
+            self.start_spill_thread()
+            self.spill_queue.put(entry)
+            size, users = roots[id(buffer_root(pixels))]
+            users.discard(id(entry))
+            if not users:
+                total -= size
+
+    def start_spill_thread(self):
+        if self.spill_thread is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="image_editor_history_")
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+            self.spill_thread = threading.Thread(
+                target=self.spill_worker, args=(self.spill_queue, self.spill_dir), daemon=True)
+            self.spill_thread.start()
+
+    def spill_worker(self, spill_queue, spill_dir):
+        """Background thread: compress queued results losslessly and drop their pixels,
+        until close() queues None"""
+        while True:
+            entry = spill_queue.get()
+            if entry is None:
+                shutil.rmtree(spill_dir, True)
+                return
+            img = entry.state.pixels
+            if img is None or not entry.queued:
+                continue
+            path = None
+            if entry.path is None:
+                data = zlib.compress(np.ascontiguousarray(img).tobytes(), SPILL_COMPRESSION)
+                fd, path = tempfile.mkstemp(suffix=".zlib", dir=spill_dir)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+            with entry.lock:
+                if entry.discarded:
+                    if path:
+                        os.remove(path)
+                    continue
+                if path:
+                    entry.path = path
+                    entry.disk_bytes = len(data)
+                    entry.shape = img.shape
+                    entry.dtype = img.dtype
+                # an undo/redo may have needed the entry while it was being written
+                if entry.queued:
+                    entry.state.pixels = None
+                    entry.queued = False
+
+    def stats(self):
+        """Cache metrics: bytes in RAM and on disk, hit rate and restore latency"""
+        lookups = self.hits + self.misses
+        return {
+            "memory_bytes": self.memory_bytes(),
+            "disk_bytes": self.disk_bytes(),
+            "spilled": sum(1 for e in self.entries() if e.path and e.state.pixels is None),
+            "hit_rate": self.hits / lookups if lookups else 1.0,
+            "avg_restore_ms": 1000 * sum(self.restore_times) / len(self.restore_times)
+            if self.restore_times else 0.0,
+            "max_restore_ms": 1000 * max(self.restore_times) if self.restore_times else 0.0,
+        }
+
+
+class ImagePyramid:
+    """Stack of successively halved copies of an image, level 0 is the image itself.
+    size can give a larger logical size when img is only a reduced proxy of the image."""
+    def __init__(self, img, tile_size=TILE_SIZE, size=None, check=None, levels=None):
+        self.width, self.height = size if size else (img.shape[1], img.shape[0])
+        self.version = next(_pyramid_versions)
+        self.levels = list(levels) if levels else [img]
+        while max(self.levels[-1].shape[:2]) > tile_size:
+            if check:
+                check()
+            h, w = self.levels[-1].shape[:2]
+            half = cv2.resize(self.levels[-1], (max(1, w // 2), max(1, h // 2)),
+                              interpolation=cv2.INTER_AREA)
+            self.levels.append(half)
+
+    def reduced(self, max_size):
+        """Pyramid of the same image keeping only the levels that fit in max_size, the
+        larger ones are released. Returns self when nothing would be dropped."""
+        level = 0
+        while level < len(self.levels) - 1 and max(self.levels[level].shape[:2]) > max_size:
+            level += 1
+        if level == 0:
+            return self
+        return ImagePyramid(self.levels[level], size=(self.width, self.height),
+                            levels=self.levels[level:])
+
+    def level_scale(self, level):
+        """Number of full resolution pixels covered by one pixel of a level"""
+        return self.width / self.levels[level].shape[1]
+
+    def level_for_zoom(self, zoom, quality="balanced"):
+        """Pick the coarsest level that still has at least one pixel per screen pixel,
+        moved by the level bias of the quality tier"""
+        level = 0
+        for i in range(1, len(self.levels)):
+            if self.level_scale(i) * zoom > 1.0:
+                break
+            level = i
+        return min(len(self.levels) - 1, max(0, level + QUALITY_TIERS[quality][0]))
+
+    def thumbnail(self, max_size):
+        """Small copy of the image fitting in max_size, made from the closest level"""
+        level = len(self.levels) - 1
+        while level > 0 and max(self.levels[level].shape[:2]) < max_size:
+            level -= 1
+        img = self.levels[level]
+        h, w = img.shape[:2]
+        factor = min(max_size / w, max_size / h, 1.0)
+        if factor < 1.0:
+            img = cv2.resize(img, (max(1, round(w * factor)), max(1, round(h * factor))),
+                             interpolation=cv2.INTER_AREA)
+        return img
+
+
+def resample_filter(quality, src_w, out_w):
+    """OpenCV interpolation of a quality tier for scaling src_w pixels to out_w"""
+    _, shrink, enlarge = QUALITY_TIERS[quality]
+    return shrink if out_w < src_w else enlarge
+
+
+def render_region(pyramid, box, size, exact=False, quality="balanced"):
+    """Resample the rectangle box (x0, y0, x1, y1) of a pyramid's full resolution image,
+    which may have fractional edges, to size pixels in a single step. Reads from the
+    pyramid level the quality tier asks for, exact always reads the full resolution pixels."""
+    out_w, out_h = size
+    bx0, by0, bx1, by1 = box
+    level = 0 if exact else pyramid.level_for_zoom(out_w / (bx1 - bx0), quality)
+    img = pyramid.levels[level]
+    h, w = img.shape[:2]
+    sx, sy = pyramid.width / w, pyramid.height / h
+    lx0, ly0, lx1, ly1 = bx0 / sx, by0 / sy, bx1 / sx, by1 / sy
+    if all(abs(v - round(v)) < 1e-6 for v in (lx0, ly0, lx1, ly1)):
+        view = img[round(ly0):round(ly1), round(lx0):round(lx1)]
+        if view.shape[1] == out_w and view.shape[0] == out_h:
+            return view
+        interpolation = resample_filter(quality, view.shape[1], out_w)
+        if exact:
+            return resize_banded(view, size, interpolation)
+        return cv2.resize(view, size, interpolation=interpolation)
+    # fractional rectangle (a crop made after a resize): an affine warp of the window
+    # around it, output pixel centres mapped onto the matching source positions
+    ix0, iy0 = max(0, math.floor(lx0)), max(0, math.floor(ly0))
+    ix1, iy1 = min(w, math.ceil(lx1)), min(h, math.ceil(ly1))
+    window = img[iy0:iy1, ix0:ix1]
+    fx, fy = out_w / (lx1 - lx0), out_h / (ly1 - ly0)
+    # a bilinear warp alone aliases when shrinking: the whole window is first reduced
+    # with INTER_AREA to about the output scale, the warp then only adds the sub pixel
+    # offset and what is left of the scale
+    rx = ry = 1.0
+    if quality != "draft" and (fx < 1 or fy < 1):
+        win_h, win_w = window.shape[:2]
+        small_w = max(1, math.ceil(win_w * fx)) if fx < 1 else win_w
+        small_h = max(1, math.ceil(win_h * fy)) if fy < 1 else win_h
+        if exact:
+            window = resize_banded(window, (small_w, small_h), cv2.INTER_AREA)
+        else:
+            window = cv2.resize(window, (small_w, small_h), interpolation=cv2.INTER_AREA)
+        rx, ry = small_w / win_w, small_h / win_h
+    matrix = np.float32([[rx / fx, 0, rx * (lx0 - ix0) + 0.5 * rx / fx - 0.5],
+                         [0, ry / fy, ry * (ly0 - iy0) + 0.5 * ry / fy - 0.5]])
+    interpolation = cv2.INTER_NEAREST if quality == "draft" else cv2.INTER_LINEAR
+    return cv2.warpAffine(window, matrix, size, flags=interpolation | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+class EditState:
+    """Non-destructive edit: the crop and resize operations applied to a source image,
+    recorded against the original pixels. Consecutive operations fold into a single
+    source rectangle and output size, so every result is one resample of the original,
+    computed lazily for the region and resolution that is displayed or exported."""
+    def __init__(self, source, ops=()):
+        self.source = source  # ImagePyramid of the original image
+        self.ops = tuple(ops)
+        self.box, self.size = self.fold()
+        self.pixels = None  # cached full result, filled in by materialize()
+
+    def fold(self):
+        """Compose the operations into (source rectangle, output size)"""
+        x0, y0, x1, y1 = 0.0, 0.0, float(self.source.width), float(self.source.height)
+        out_w, out_h = self.source.width, self.source.height
+        for op, arg in self.ops:
+            if op == "crop":
+                sx, sy = (x1 - x0) / out_w, (y1 - y0) / out_h
+                cx0, cy0, cx1, cy1 = arg
+                x0, y0, x1, y1 = x0 + cx0 * sx, y0 + cy0 * sy, x0 + cx1 * sx, y0 + cy1 * sy
+                out_w, out_h = cx1 - cx0, cy1 - cy0
+            elif op == "resize":
+                out_w, out_h = arg
+        return (x0, y0, x1, y1), (out_w, out_h)
+
+    def crop(self, box):
+        """New state cropped to box (x0, y0, x1, y1) in this state's output pixels"""
+        return EditState(self.source, self.ops + (("crop", tuple(box)),))
+
+    def resize(self, size):
+        """New state resized to size, replacing a resize that was the last operation"""
+        ops = self.ops[:-1] if self.ops and self.ops[-1][0] == "resize" else self.ops
+        return EditState(self.source, ops + (("resize", tuple(size)),))
+
+    def with_source(self, source):
+        return EditState(source, self.ops)
+
+    @property
+    def key(self):
+        """Identifies the pixels of this state: equal keys render identical images"""
+        return (self.source.version, self.box, self.size)
+
+    @property
+    def cropped(self):
+        return any(op == "crop" for op, _ in self.ops)
+
+    def source_box(self):
+        """The source rectangle rounded to whole pixels, for messages"""
+        return tuple(round(v) for v in self.box)
+
+    def crop_box(self):
+        """Source rectangle in whole pixels when the result is a plain crop of the
+        original (nothing resampled), None otherwise"""
+        box = self.source_box()
+        if any(abs(v - r) > 1e-6 for v, r in zip(self.box, box)):
+            return None
+        if self.size != (box[2] - box[0], box[3] - box[1]):
+            return None
+        return box
+
+    def render(self, size, quality="high"):
+        """The whole result resampled to size pixels, for previews and thumbnails"""
+        return render_region(self.source, self.box, size, quality=quality)
+
+    def thumbnail(self, max_size, quality="high"):
+        w, h = self.size
+        factor = min(max_size / w, max_size / h, 1.0)
+        return self.render((max(1, round(w * factor)), max(1, round(h * factor))), quality)
+
+    def materialize(self):
+        """Full resolution result, computed once from the original pixels and cached.
+        Exports always use the high quality filters."""
+        if self.pixels is None:
+            self.pixels = freeze(render_region(self.source, self.box, self.size, exact=True,
+                                               quality="high"))
+        return self.pixels
+
+    def buffers(self):
+        """Arrays this state keeps alive, for memory accounting"""
+        arrays = list(self.source.levels)
+        if self.pixels is not None:
+            arrays.append(self.pixels)
+        return arrays
+
+
+class Document:
+    """One open image: the file it came from, the pyramid of its pixels, the current
+    edit and its own undo history. While preview is set the source only holds reduced
+    pixels (a fast open, or a shrunk inactive document) and the full ones are decoded
+    from the file again."""
+    def __init__(self, path, source, preview=False):
+        self.path = path
+        self.source = source
+        self.state = EditState(source)
+        self.history = EditHistory()
+        self.preview = preview
+        self.last_used = 0
+        self.view = None  # (zoom, origin, size) of the canvas when it was last shown
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def set_source(self, source, preview=False):
+        """Replace the pixels under every edit, they are in full resolution coordinates
+        so only the source changes"""
+        self.source = source
+        self.preview = preview
+        self.state = self.state.with_source(source)
+        self.history.remap(lambda state: state.with_source(source))
+
+    def shrink(self, preview_size=SESSION_PREVIEW_SIZE):
+        """Keep a preview of at most preview_size and drop the full resolution levels
+        and cached results, returns the bytes released"""
+        reduced = self.source.reduced(preview_size)
+        if reduced is self.source:
+            return 0
+        before = self.memory_bytes()
+        self.set_source(reduced, preview=True)
+        return before - self.memory_bytes()
+
+    def buffers(self):
+        arrays = list(self.state.buffers())
+        for entry in self.history.entries():
+            arrays.extend(entry.state.buffers())
+        return arrays
+
+    def memory_bytes(self):
+        roots = {}
+        for img in self.buffers():
+            root = buffer_root(img)
+            roots[id(root)] = root.nbytes
+        return sum(roots.values())
+
+    @property
+    def edited(self):
+        return bool(self.state.ops or self.history.undo_stack or self.history.redo_stack)
+
+    def close(self):
+        self.history.close()
+
+
+class DocumentSession:
+    """The open documents and which one is active. All of them share one memory
+    budget: when it is exceeded the least recently used inactive documents are shrunk
+    to previews, the active one always keeps its full resolution pixels."""
+    def __init__(self, budget_mb=SESSION_BUDGET_MB, preview_size=SESSION_PREVIEW_SIZE):
+        self.documents = []
+        self.active = None
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.preview_size = preview_size
+        self.clock = itertools.count(1)
+
+    def add(self, doc):
+        self.documents.append(doc)
+        self.activate(doc)
+
+    def activate(self, doc):
+        self.active = doc
+        doc.last_used = next(self.clock)
+        self.enforce_budget()
+
+    def replace(self, old, new):
+        """Put new in old's place, used when browsing from an unedited image"""
+        self.documents[self.documents.index(old)] = new
+        old.close()
+        self.activate(new)
+
+    def close(self, doc):
+        """Close a document, the neighbour becomes active if it was. Returns the active one"""
+        index = self.documents.index(doc)
+        self.documents.remove(doc)
+        doc.close()
+        if doc is self.active:
+            self.active = None
+            if self.documents:
+                self.activate(self.documents[min(index, len(self.documents) - 1)])
+        return self.active
+
+    def close_all(self):
+        """Close every document, on exit"""
+        for doc in self.documents:
+            doc.close()
+        self.documents.clear()
+        self.active = None
+
+    def neighbour(self, step):
+        """Document step places after the active one, wrapping around"""
+        if not self.documents:
+            return None
+        index = self.documents.index(self.active) if self.active in self.documents else 0
+        return self.documents[(index + step) % len(self.documents)]
+
+    def memory_bytes(self):
+        return sum(doc.memory_bytes() for doc in self.documents)
+
+    def enforce_budget(self):
+        """Shrink inactive documents, least recently used first, until all fit"""
+        total = self.memory_bytes()
+        for doc in sorted(self.documents, key=lambda d: d.last_used):
+            if total <= self.budget_bytes:
+                break
+            if doc is not self.active:
+                total -= doc.shrink(self.preview_size)
+
@@ -0,0 +1,281 @@
+"""Export of edited images with tunable encoders.
+
+Images are BGR arrays like everywhere in the editor. PNG and TIFF are written by small
+streaming writers that swap the channels and encode one strip or tile at a time, so no
+second full size buffer is built. JPEG and the other formats go to OpenCV, which takes
+BGR as it is."""
+
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# Encoder settings used when nothing else is chosen
+EXPORT_DEFAULTS = {
+    "png_compression": 6,       # zlib level 0-9, 0 is fastest, 9 smallest
+    "jpeg_quality": 90,         # 1-100
+    "jpeg_progressive": False,  # progressive JPEGs are a bit smaller and slower to write
+    "tiff_compression": "deflate",  # "none" or "deflate"
+    "tiff_tile": 0,             # tile side in pixels (multiple of 16), 0 writes strips
+    "lossless_crop": True,      # plain crops of JPEG/TIFF originals are cut from the file
+}
+TIFF_COMPRESSIONS = ("none", "deflate")
+TIFF_TILE_SIZES = (0, 128, 256, 512)
+# Threads encoding the files of an export set at the same time (zlib, libpng and
+# libjpeg all release the GIL while they work)
+EXPORT_SET_WORKERS = min(4, os.cpu_count() or 1)
+# Rows encoded at a time by the PNG writer and per strip in TIFF files
+STRIP_ROWS = 64
+
+
+def export_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".png":
+        return "png"
+    if ext in (".tif", ".tiff"):
+        return "tiff"
+    if ext in (".jpg", ".jpeg"):
+        return "jpeg"
+    return ext.lstrip(".")
+
+
+def export_image(path, img, options=None, progress=None, check=None):
+    """Encode the BGR array img to path with the options of its format, returns the file
+    size. progress(fraction) is called as strips are written, check() may raise to
+    cancel, a partly written file is removed."""
+    opts = dict(EXPORT_DEFAULTS, **(options or {}))
+    fmt = export_format(path)
+    try:
+        if fmt == "png":
+            write_png(path, img, opts["png_compression"], progress, check)
+        elif fmt == "tiff":
+            write_tiff(path, img, opts["tiff_compression"], opts["tiff_tile"], progress, check)
+        else:
+            write_cv2(path, img, fmt, opts)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    if progress:
+        progress(1.0)
+    return os.path.getsize(path)
+
+
+def write_cv2(path, img, fmt, opts):
+    """Formats without a streaming writer, OpenCV encodes the BGR array directly"""
+    params = []
+    if fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(opts["jpeg_quality"]),
+                  cv2.IMWRITE_JPEG_PROGRESSIVE, int(opts["jpeg_progressive"]),
+                  cv2.IMWRITE_JPEG_OPTIMIZE, int(opts["jpeg_progressive"])]
+    try:
+        ok = cv2.imwrite(path, img, params)
+    except cv2.error as e:
+        raise ValueError(f"Failed to save {os.path.basename(path)}: {e}")
+    if not ok:
+        raise ValueError(f"Failed to save {os.path.basename(path)}")
+
+
+def png_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xffffffff))
+
+
+def write_png(path, img, level, progress=None, check=None):
+    """Streaming 8 bit RGB PNG: rows are swapped to RGB, filtered and deflated
+    STRIP_ROWS at a time"""
+    h, w = img.shape[:2]
+    row_bytes = w * 3
+    compressor = zlib.compressobj(level)
+    # the "up" filter (each row minus the one above) makes photos compress much better,
+    # without compression it only costs time
+    filter_type = 2 if level > 0 else 0
+    previous = np.zeros(row_bytes, dtype=np.uint8)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+        for y0 in range(0, h, STRIP_ROWS):
+            if check:
+                check()
+            rgb = np.ascontiguousarray(img[y0:y0 + STRIP_ROWS, :, ::-1])
+            rows = rgb.reshape(-1, row_bytes)
+            strip = np.empty((rows.shape[0], row_bytes + 1), dtype=np.uint8)
+            strip[:, 0] = filter_type
+            if filter_type:
+                np.subtract(rows[0], previous, out=strip[0, 1:])
+                np.subtract(rows[1:], rows[:-1], out=strip[1:, 1:])
+            else:
+                strip[:, 1:] = rows
+            previous = rows[-1]
+            data = compressor.compress(strip)
+            if data:
+                png_chunk(f, b"IDAT", data)
+            if progress:
+                progress(min(h, y0 + STRIP_ROWS) / h)
+        png_chunk(f, b"IDAT", compressor.flush())
+        png_chunk(f, b"IEND", b"")
+
+
+def tiff_blocks(h, w, tile):
+    """(y0, y1, x0, x1) of the strips or tiles of a TIFF image in file order"""
+    if not tile:
+        return [(y0, min(h, y0 + STRIP_ROWS), 0, w) for y0 in range(0, h, STRIP_ROWS)]
+    return [(y0, min(h, y0 + tile), x0, min(w, x0 + tile))
+            for y0 in range(0, h, tile) for x0 in range(0, w, tile)]
+
+
+def write_tiff(path, img, compression="deflate", tile=0, progress=None, check=None):
+    """Streaming 8 bit RGB baseline TIFF in strips, or in tile x tile tiles, optionally
+    deflate compressed with the horizontal differencing predictor"""
+    if compression not in TIFF_COMPRESSIONS:
+        raise ValueError(f"Unknown TIFF compression {compression}")
+    if tile and tile % 16:
+        raise ValueError("TIFF tiles must be a multiple of 16 pixels")
+    h, w = img.shape[:2]
+    deflate = compression == "deflate"
+    blocks = tiff_blocks(h, w, tile)
+    offsets, counts = [], []
+    with open(path, "wb") as f:
+        f.write(b"II*\x00\x00\x00\x00\x00")  # the IFD offset is filled in at the end
+        for i, (y0, y1, x0, x1) in enumerate(blocks):
+            if check:
+                check()
+            block = img[y0:y1, x0:x1, ::-1]
+            if tile and block.shape[:2] != (tile, tile):
+                # edge tiles are always stored at full tile size
+                padded = np.zeros((tile, tile, 3), dtype=np.uint8)
+                padded[:y1 - y0, :x1 - x0] = block
+                block = padded
+            if deflate:
+                diff = np.array(block)
+                np.subtract(block[:, 1:], block[:, :-1], out=diff[:, 1:])
+                data = zlib.compress(diff, 6)
+            else:
+                data = np.ascontiguousarray(block).tobytes()
+            offsets.append(f.tell())
+            counts.append(len(data))
+            f.write(data)
+            if progress:
+                progress((i + 1) / len(blocks))
+        if f.tell() + 8 * len(blocks) + 256 >= 2 ** 32:
+            raise ValueError("TIFF files are limited to 4 GB, use compression or PNG")
+        write_tiff_ifd(f, w, h, deflate, tile, offsets, counts)
+
+
+def write_tiff_ifd(f, w, h, deflate, tile, offsets, counts):
+    """Append the image file directory and point the header at it"""
+    if f.tell() % 2:
+        f.write(b"\x00")
+
+    def array(fmt, values):
+        position = f.tell()
+        f.write(struct.pack(f"<{len(values)}{fmt}", *values))
+        return position
+
+    bits = array("H", (8, 8, 8))
+    offsets_at = array("I", offsets) if len(offsets) > 1 else offsets[0]
+    counts_at = array("I", counts) if len(counts) > 1 else counts[0]
+    short, long_ = 3, 4
+    entries = [(256, long_, 1, w), (257, long_, 1, h), (258, short, 3, bits),
+               (259, short, 1, 8 if deflate else 1), (262, short, 1, 2),
+               (277, short, 1, 3), (284, short, 1, 1)]
+    if deflate:
+        entries.append((317, short, 1, 2))
+    if tile:
+        entries += [(322, long_, 1, tile), (323, long_, 1, tile),
+                    (324, long_, len(offsets), offsets_at), (325, long_, len(counts), counts_at)]
+    else:
+        entries += [(273, long_, len(offsets), offsets_at), (278, long_, 1, STRIP_ROWS),
+                    (279, long_, len(counts), counts_at)]
+    entries.sort()
+    if f.tell() % 2:
+        f.write(b"\x00")
+    ifd = f.tell()
+    f.write(struct.pack("<H", len(entries)))
+    for tag, kind, count, value in entries:
+        if kind == short and count == 1:
+            f.write(struct.pack("<HHIHH", tag, kind, count, value, 0))
+        else:
+            f.write(struct.pack("<HHII", tag, kind, count, value))
+    f.write(struct.pack("<I", 0))
+    f.seek(4)
+    f.write(struct.pack("<I", ifd))
+
+
+def parse_size(spec, width, height):
+    """Output size of a size spec for a width x height image: "50%" scales, "256px" or
+    "256" fits the longest side, "800x600" fits inside that box. Keeps the aspect ratio."""
+    spec = spec.strip().lower()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*%", spec)
+    if match:
+        factor = float(match.group(1)) / 100
+    elif re.fullmatch(r"\d+\s*(px)?", spec):
+        factor = int(re.match(r"\d+", spec).group()) / max(width, height)
+    elif re.fullmatch(r"\d+\s*x\s*\d+", spec):
+        box_w, box_h = (int(v) for v in spec.split("x"))
+        factor = min(box_w / width, box_h / height)
+    else:
+        raise ValueError(f"Unknown size '{spec}', use 50%, 256px or 800x600")
+    if factor <= 0:
+        raise ValueError(f"Size '{spec}' is empty")
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def export_set_paths(path, sizes):
+    """File name of every size: the chosen name with _<width>x<height> added"""
+    stem, ext = os.path.splitext(path)
+    return [f"{stem}_{w}x{h}{ext}" for w, h in sizes]
+
+
+def export_set(path, img, specs, options=None, progress=None, check=None,
+               workers=EXPORT_SET_WORKERS):
+    """Export img at several sizes in one pass. The sizes are made largest first, each
+    smaller one resampled from the previous output rather than from img (a downsample
+    cascade), and every output is encoded on its own thread as soon as it exists.
+    Returns [(path, (width, height), file size)] largest first."""
+    height, width = img.shape[:2]
+    sizes = sorted({parse_size(spec, width, height) for spec in specs},
+                   key=lambda size: size[0] * size[1], reverse=True)
+    if not sizes:
+        raise ValueError("No sizes to export")
+    paths = export_set_paths(path, sizes)
+    done = []
+
+    def encode(out_path, out):
+        size = export_image(out_path, out, options, check=check)
+        done.append(out_path)
+        if progress:
+            progress(len(done) / len(sizes))
+        return size
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            previous = img
+            for out_path, (w, h) in zip(paths, sizes):
+                if check:
+                    check()
+                if (w, h) == (width, height):
+                    out = img
+                elif w <= previous.shape[1] and h <= previous.shape[0]:
+                    out = cv2.resize(previous, (w, h), interpolation=cv2.INTER_AREA)
+                else:
+                    # larger than the source: enlarge the source itself
+                    out = cv2.resize(img, (w, h), interpolation=cv2.INTER_CUBIC)
+                if w <= width and h <= height:
+                    previous = out
+                futures.append(pool.submit(encode, out_path, out))
+            file_sizes = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            for out_path in paths:
+                if os.path.exists(out_path):
+                    os.remove(out_path)
+            raise
+    return list(zip(paths, sizes, file_sizes))
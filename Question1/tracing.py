@@ -0,0 +1,114 @@
+"""Timing and memory tracing of editor operations, exported as Chrome trace files.
+Kept apart from editor_core so the window can use it before the imaging stack is loaded."""
+
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# Operation events kept by the tracer for the trace file, older ones are dropped
+TRACE_MAX_EVENTS = 20000
+
+
+class OperationTracer:
+    """Records wall time, array memory allocated (through tracemalloc, which sees numpy
+    and OpenCV arrays) and counted events such as PhotoImage rebuilds for named
+    operations. Spans can nest and run on any thread, counts go to every open span.
+    The tracemalloc peak is process wide: a span opened while another one is open on any
+    thread reports the peak since the outermost one started."""
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.start = time.perf_counter()
+        self.events = deque(maxlen=TRACE_MAX_EVENTS)
+        self.totals = {}  # name -> {"calls", "seconds", "bytes" (with trace_memory), counters...}
+        self.last = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.open_spans = 0  # on all threads, the peak is only reset when there are none
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name):
+        """Time the with-block as operation name"""
+        stack = self.stack()
+        if self.trace_memory:
+            # started with the first span rather than at startup, tracing slows imports down
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            with self.lock:
+                if not self.open_spans and hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                self.open_spans += 1
+                mem_start = tracemalloc.get_traced_memory()[0]
+        counts = {}
+        stack.append(counts)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            allocated = 0
+            if self.trace_memory:
+                with self.lock:
+                    self.open_spans -= 1
+                    allocated = max(0, tracemalloc.get_traced_memory()[1] - mem_start)
+            self.record(name, start, seconds, allocated, counts)
+
+    def count(self, counter, n=1):
+        """Add n to counter in every span open on this thread"""
+        for counts in self.stack():
+            counts[counter] = counts.get(counter, 0) + n
+
+    def record(self, name, start, seconds, allocated, counts):
+        event = {"name": name, "start": start - self.start, "seconds": seconds,
+                 "thread": threading.get_ident(), **counts}
+        if self.trace_memory:
+            event["bytes"] = allocated  # left out otherwise, a 0 would look measured
+        with self.lock:
+            self.events.append(event)
+            total = self.totals.setdefault(name, {"calls": 0, "seconds": 0.0})
+            total["calls"] += 1
+            total["seconds"] += seconds
+            if self.trace_memory:
+                total["bytes"] = total.get("bytes", 0) + allocated
+            for counter, n in counts.items():
+                total[counter] = total.get(counter, 0) + n
+            self.last = event
+
+    def summary(self, top=3):
+        """One line: the last operation and where most time went so far"""
+        with self.lock:
+            last = self.last
+            totals = sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])[:top]
+        if last is None:
+            return "No operations yet"
+        text = f"{last['name']} {last['seconds'] * 1000:.1f} ms"
+        if "bytes" in last:
+            text += f", {last['bytes'] / (1024 * 1024):.1f} MB"
+        if last.get("photos"):
+            text += f", {last['photos']} images"
+        text += " | total: " + ", ".join(f"{name} {t['seconds'] * 1000:.0f} ms in {t['calls']}"
+                                          for name, t in totals)
+        return text
+
+    def export(self, path):
+        """Write the events as a Chrome trace (chrome://tracing, Perfetto) with the
+        per operation totals added as totals"""
+        with self.lock:
+            events = list(self.events)
+            totals = {name: dict(t) for name, t in self.totals.items()}
+        trace = [{"name": e["name"], "ph": "X", "pid": os.getpid(), "tid": e["thread"],
+                  "ts": round(e["start"] * 1e6), "dur": round(e["seconds"] * 1e6),
+                  "args": {k: v for k, v in e.items()
+                           if k not in ("name", "start", "seconds", "thread")}}
+                 for e in events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms", "totals": totals}, f)
@@ -1,6 +1,8 @@
 import pygame
 import random
 import os
+import time
+from collision import SpatialHash, collide_precise
 
 # Initialize Pygame and mixer
 pygame.init()
@@ -24,6 +26,23 @@ DOUBLE_JUMP_MULTIPLIER = 2
 DOUBLE_TAP_TIME = 300  # milliseconds allowed between taps
 
 GROUND_HEIGHT = 70  # height of the ground image in pixels
+# While playing only the changed parts of the screen are redrawn and sent to the display,
+# when more than this share of the screen changed one full flip is cheaper
+DIRTY_FLIP_FRACTION = 0.4
+
+# Sprite pools: killed sprites of each kind kept for reuse, made up front at startup.
+# More are created if the game ever needs them, only this many are kept afterwards.
+POOL_SIZES = {
+    "projectile": 32,
+    "boss_bullet": 16,
+    "enemy": 16,
+    "enemy2": 4,
+    "enemy3": 4,
+    "collectible": 4,
+}
+
+# Images and sounds are looked up next to this file, so the game runs from any directory
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Colors
 WHITE = (255, 255, 255)
@@ -39,55 +58,107 @@ BLUE = (0, 0, 255)
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 pygame.display.set_caption("Side-Scrolling Game")
 
-# Load menu background image with error handling and alpha support
-try:
-    menu_background = pygame.image.load("load.png").convert_alpha()
-    menu_background = pygame.transform.scale(menu_background, (SCREEN_WIDTH, SCREEN_HEIGHT))
-    print("Menu background loaded successfully.")
-except pygame.error as e:
-    print(f"Failed to load menu background: {e}")
-    menu_background = None
-
-# Load end screen background image with error handling and alpha support
-try:
-    end_background = pygame.image.load("background.png").convert_alpha()
-    end_background = pygame.transform.scale(end_background, (SCREEN_WIDTH, SCREEN_HEIGHT))
-    print("End screen background loaded successfully.")
-except pygame.error as e:
-    print(f"Failed to load end screen background: {e}")
-    end_background = None
+# Every image the game draws: name -> (file, size, fallback color[, fallback size]).
+# A missing file is replaced by a plain box of the fallback color, or None for the
+# backgrounds, which then fall back to a white screen.
+SPRITE_ASSETS = {
+    "menu_background": ("load.png", (SCREEN_WIDTH, SCREEN_HEIGHT), None),
+    "end_background": ("background.png", (SCREEN_WIDTH, SCREEN_HEIGHT), None),
+    "cloud": ("cloud.png", (150, 100), (200, 200, 255)),  # Light blue placeholder
+    "ground": ("ground.png", (SCREEN_WIDTH, GROUND_HEIGHT), (139, 69, 19)),  # Brown placeholder
+    "player": ("player.png", (50, 50), GREEN),
+    "fireball": ("fireball.png", (20, 20), (255, 69, 0), (10, 5)),
+    "superfireball": ("Superfireball.png", (20, 20), (255, 69, 0), (10, 5)),
+    "enemy": ("enemy.png", (50, 50), BLACK),
+    "enemy2": ("enemy2.png", (60, 60), PURPLE),
+    "enemy3": ("enemy3.png", (70, 70), BLUE),
+    "boss": ("boss.png", (120, 120), ORANGE),
+    "boss_bullet": ("bullet.png", (40, 20), YELLOW),
+    "mushroom": ("mushroom.png", (COLLECTIBLE_SIZE, COLLECTIBLE_SIZE), (0, 0, 255)),  # fallback blue box
+}
+
+# Asset manager: loads, converts and scales every image once so sprites share surfaces,
+# and builds the collision mask of each one the first time it is needed
+class AssetManager:
+    def __init__(self, folder=ASSET_DIR):
+        self.folder = folder
+        self.surfaces = {}
+        self.masks = {}
+        self.failed = []
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+
+    def preload(self, assets):
+        start = time.perf_counter()
+        for name, entry in assets.items():
+            self.surfaces[name] = self.load(*entry)
+        self.load_time += time.perf_counter() - start
+
+    def load(self, filename, size, fallback_color, fallback_size=None):
+        try:
+            image = pygame.image.load(os.path.join(self.folder, filename)).convert_alpha()
+            return pygame.transform.scale(image, size)
+        except (pygame.error, OSError) as e:
+            print(f"Failed to load {filename}: {e}")
+            self.failed.append(filename)
+            if fallback_color is None:
+                return None
+            image = pygame.Surface(fallback_size or size)
+            image.fill(fallback_color)
+            return image
+
+    def get(self, name):
+        if name in self.surfaces:
+            self.hits += 1
+            return self.surfaces[name]
+        # not preloaded: load it now, once
+        self.misses += 1
+        start = time.perf_counter()
+        self.surfaces[name] = self.load(*SPRITE_ASSETS[name])
+        self.load_time += time.perf_counter() - start
+        return self.surfaces[name]
+
+    def mask(self, name):
+        # opaque pixels of the scaled image, so transparent padding never collides
+        if name not in self.masks:
+            self.masks[name] = pygame.mask.from_surface(self.get(name))
+        return self.masks[name]
+
+    def memory_bytes(self):
+        return sum(image.get_bytesize() * image.get_width() * image.get_height()
+                   for image in self.surfaces.values() if image is not None)
+
+    def stats(self):
+        return (f"{len(self.surfaces)} images loaded in {self.load_time * 1000:.1f} ms "
+                f"({len(self.failed)} fallbacks, {self.memory_bytes() / 1024:.0f} KB), "
+                f"{self.hits} cache hits, {self.misses} misses, {len(self.masks)} masks")
+
+
+# Load all images once, before the first sprite is made
+assets = AssetManager()
+assets.preload(SPRITE_ASSETS)
+print(f"Assets: {assets.stats()}")
+menu_background = assets.get("menu_background")
+end_background = assets.get("end_background")
 
 # Load sound effects with error handling
 try:
-    jump_sound = pygame.mixer.Sound("jump.wav")
+    jump_sound = pygame.mixer.Sound(os.path.join(ASSET_DIR, "jump.wav"))
 except pygame.error:
     jump_sound = None
 try:
-    hit_sound = pygame.mixer.Sound("hit.wav")
+    hit_sound = pygame.mixer.Sound(os.path.join(ASSET_DIR, "hit.wav"))
 except pygame.error:
     hit_sound = None
 
 try:
-    pygame.mixer.music.load("mario.wav")
+    pygame.mixer.music.load(os.path.join(ASSET_DIR, "mario.wav"))
 except pygame.error:
     pass
 
-# Load cloud image
-try:
-    cloud_image = pygame.image.load("cloud.png").convert_alpha()
-    cloud_image = pygame.transform.scale(cloud_image, (150, 100))  # Resize as needed
-except pygame.error:
-    cloud_image = pygame.Surface((150, 100))
-    cloud_image.fill((200, 200, 255))  # Light blue placeholder
-
-# Load ground image with error handling
-try:
-    ground_image = pygame.image.load("ground.png").convert_alpha()
-    # Scale ground image width to screen width, height to GROUND_HEIGHT
-    ground_image = pygame.transform.scale(ground_image, (SCREEN_WIDTH, GROUND_HEIGHT))
-except pygame.error:
-    ground_image = pygame.Surface((SCREEN_WIDTH, GROUND_HEIGHT))
-    ground_image.fill((139, 69, 19))  # Brown color placeholder
+cloud_image = assets.get("cloud")
+ground_image = assets.get("ground")
 
 # Cloud Class for moving clouds
 class Cloud(pygame.sprite.Sprite):
@@ -108,16 +179,76 @@ class Cloud(pygame.sprite.Sprite):
             self.speed = random.uniform(0.5, 1.5)
 
 
+# Sprite pool: spawn() reuses a killed sprite and resets it in place, so shots and
+# enemies don't create garbage every frame
+class SpritePool:
+    def __init__(self, sprite_class, capacity):
+        self.sprite_class = sprite_class
+        self.capacity = capacity
+        self.free = []
+        self.active = 0
+        self.peak = 0
+        self.created = 0
+        self.reused = 0
+        for _ in range(capacity):
+            self.free.append(self.create())
+
+    def create(self):
+        sprite = self.sprite_class()
+        sprite.pool = self
+        self.created += 1
+        return sprite
+
+    def spawn(self, *args):
+        if self.free:
+            sprite = self.free.pop()
+            self.reused += 1
+        else:
+            sprite = self.create()
+        sprite.reset(*args)
+        sprite.in_use = True
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return sprite
+
+    def release(self, sprite):
+        if not sprite.in_use:
+            return  # already back, e.g. killed twice in one frame
+        sprite.in_use = False
+        self.active -= 1
+        if len(self.free) < self.capacity:
+            self.free.append(sprite)
+
+    def stats(self):
+        return (f"{self.sprite_class.__name__}: {self.active} active (peak {self.peak}), "
+                f"{len(self.free)}/{self.capacity} free, {self.created} created, "
+                f"{self.reused} reused")
+
+# Sprites that live in a pool go back to it when they are killed
+class PooledSprite(pygame.sprite.Sprite):
+    pool = None
+    in_use = False
+
+    def kill(self):
+        super().kill()
+        if self.pool is not None:
+            self.pool.release(self)
+
+    # Fit the rect to the current image in place: a reused sprite keeps its Rect and
+    # only the first spawn creates one, reset() then sets the position
+    def fit_rect(self):
+        if getattr(self, "rect", None) is None:
+            self.rect = self.image.get_rect()
+        else:
+            self.rect.size = self.image.get_size()
+
+
 # Player Class
 class Player(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("player.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (50, 50))
-        except pygame.error:
-            self.image = pygame.Surface((50, 50))
-            self.image.fill(GREEN)
+        self.image = assets.get("player")
+        self.mask = assets.mask("player")
         self.rect = self.image.get_rect()
         self.rect.x = 50
         self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - self.rect.height  # Start on top of ground
@@ -164,20 +295,17 @@ class Player(pygame.sprite.Sprite):
             self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - self.rect.height
 
 # Projectile Class with Fireball Image
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, x, y, super_fire=False):
+class Projectile(PooledSprite):
+    def __init__(self, x=0, y=0, super_fire=False):
         super().__init__()
+        self.reset(x, y, super_fire)
+
+    def reset(self, x, y, super_fire=False):
         self.super_fire = super_fire
-        try:
-            if super_fire:
-                self.image = pygame.image.load(os.path.join("superfireball.png")).convert_alpha()
-            else:
-                self.image = pygame.image.load(os.path.join("fireball.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (20, 20))
-        except pygame.error:
-            self.image = pygame.Surface((10, 5))
-            self.image.fill((255, 69, 0))
-        self.rect = self.image.get_rect()
+        name = "superfireball" if super_fire else "fireball"
+        self.image = assets.get(name)
+        self.mask = assets.mask(name)
+        self.fit_rect()
         self.rect.x = x
         self.rect.y = y
         self.speed = PROJECTILE_SPEED 
@@ -188,16 +316,15 @@ class Projectile(pygame.sprite.Sprite):
             self.kill()
 
 # Enemy Classes
-class Enemy(pygame.sprite.Sprite):
+class Enemy(PooledSprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("enemy.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (50, 50))
-        except pygame.error:
-            self.image = pygame.Surface((50, 50))
-            self.image.fill(BLACK)
-        self.rect = self.image.get_rect()
+        self.reset()
+
+    def reset(self):
+        self.image = assets.get("enemy")
+        self.mask = assets.mask("enemy")
+        self.fit_rect()
         self.rect.x = SCREEN_WIDTH
         self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - self.rect.height
         self.speed = ENEMY_SPEED
@@ -208,16 +335,15 @@ class Enemy(pygame.sprite.Sprite):
         if self.rect.x < 0:
             self.kill()
 
-class Enemy2(pygame.sprite.Sprite):
+class Enemy2(PooledSprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("enemy2.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (60, 60))
-        except pygame.error:
-            self.image = pygame.Surface((60, 60))
-            self.image.fill(PURPLE)
-        self.rect = self.image.get_rect()
+        self.reset()
+
+    def reset(self):
+        self.image = assets.get("enemy2")
+        self.mask = assets.mask("enemy2")
+        self.fit_rect()
         self.rect.x = SCREEN_WIDTH
         self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - self.rect.height + 10
         self.speed = ENEMY2_SPEED
@@ -228,16 +354,15 @@ class Enemy2(pygame.sprite.Sprite):
         if self.rect.x < 0:
             self.kill()
 
-class Enemy3(pygame.sprite.Sprite):
+class Enemy3(PooledSprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("enemy3.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (70, 70))
-        except pygame.error:
-            self.image = pygame.Surface((70, 70))
-            self.image.fill(BLUE)
-        self.rect = self.image.get_rect()
+        self.reset()
+
+    def reset(self):
+        self.image = assets.get("enemy3")
+        self.mask = assets.mask("enemy3")
+        self.fit_rect()
         self.rect.x = SCREEN_WIDTH
         self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - self.rect.height + 5
         self.speed = ENEMY3_SPEED
@@ -252,12 +377,8 @@ class Enemy3(pygame.sprite.Sprite):
 class BossEnemy(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("boss.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (120, 120))
-        except pygame.error:
-            self.image = pygame.Surface((120, 120))
-            self.image.fill(ORANGE)
+        self.image = assets.get("boss")
+        self.mask = assets.mask("boss")
         self.rect = self.image.get_rect()
         self.rect.x = SCREEN_WIDTH - 130
         self.rect.y = SCREEN_HEIGHT - GROUND_HEIGHT - 250  # Start higher for vertical movement
@@ -271,16 +392,15 @@ class BossEnemy(pygame.sprite.Sprite):
             self.speed_y = -self.speed_y
 
 # Boss Bullet Class
-class BossBullet(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+class BossBullet(PooledSprite):
+    def __init__(self, x=0, y=0):
         super().__init__()
-        try:
-            self.image = pygame.image.load("bullet.png").convert_alpha()
-            self.image = pygame.transform.scale(self.image, (40, 20))
-        except pygame.error:
-            self.image = pygame.Surface((40, 20))
-            self.image.fill(YELLOW)
-        self.rect = self.image.get_rect()
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        self.image = assets.get("boss_bullet")
+        self.mask = assets.mask("boss_bullet")
+        self.fit_rect()
         self.rect.x = x
         self.rect.y = y
         self.speed = BOSS_BULLET_SPEED
@@ -291,21 +411,93 @@ class BossBullet(pygame.sprite.Sprite):
             self.kill()
 
 # Collectible class with Mushroom Image
-class Collectible(pygame.sprite.Sprite):
+class Collectible(PooledSprite):
     def __init__(self):
         super().__init__()
-        try:
-            self.image = pygame.image.load(os.path.join("mushroom.png")).convert_alpha()
-            self.image = pygame.transform.scale(self.image, (COLLECTIBLE_SIZE, COLLECTIBLE_SIZE))
-        except pygame.error:
-            self.image = pygame.Surface((COLLECTIBLE_SIZE, COLLECTIBLE_SIZE))
-            self.image.fill((0, 0, 255))  # fallback blue box
-        self.rect = self.image.get_rect()
+        self.reset()
+
+    def reset(self):
+        self.image = assets.get("mushroom")
+        self.mask = assets.mask("mushroom")
+        self.fit_rect()
         self.rect.x = random.randint(100, SCREEN_WIDTH - 100)
         self.rect.y = random.randint(50, SCREEN_HEIGHT - GROUND_HEIGHT - 50)
 
+pools = {
+    "projectile": SpritePool(Projectile, POOL_SIZES["projectile"]),
+    "boss_bullet": SpritePool(BossBullet, POOL_SIZES["boss_bullet"]),
+    "enemy": SpritePool(Enemy, POOL_SIZES["enemy"]),
+    "enemy2": SpritePool(Enemy2, POOL_SIZES["enemy2"]),
+    "enemy3": SpritePool(Enemy3, POOL_SIZES["enemy3"]),
+    "collectible": SpritePool(Collectible, POOL_SIZES["collectible"]),
+}
+
 font = pygame.font.SysFont("Arial", 36)
 small_font = pygame.font.SysFont("Arial", 24)
+large_font = pygame.font.SysFont("Arial", 72)
+
+# Dirty rectangle renderer for the playing screen. The static background (sky and
+# ground) is painted once, every frame only the rects drawn in the previous frame are
+# restored from it, the new ones are drawn, and display.update() gets both lists.
+class DirtyRenderer:
+    def __init__(self, surface, background):
+        self.surface = surface
+        self.background = background
+        self.previous = []
+        self.current = []
+        self.full_redraw = True
+        self.frames = 0
+        self.full_frames = 0
+        self.pushed_area = 0
+
+    def invalidate(self):
+        # another screen was shown, the next frame repaints and flips everything
+        self.full_redraw = True
+
+    def begin(self):
+        if self.full_redraw:
+            self.surface.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous:
+                self.surface.blit(self.background, rect, rect)
+        self.current = []
+
+    def add(self, rect):
+        self.current.append(rect)
+
+    def blit(self, image, position):
+        self.current.append(self.surface.blit(image, position))
+
+    def draw_group(self, group):
+        for sprite in group:
+            self.current.append(self.surface.blit(sprite.image, sprite.rect))
+
+    def end(self):
+        dirty = self.previous + self.current
+        area = sum(rect.width * rect.height for rect in dirty)
+        screen_area = self.surface.get_width() * self.surface.get_height()
+        self.frames += 1
+        if self.full_redraw or area > DIRTY_FLIP_FRACTION * screen_area:
+            pygame.display.flip()
+            self.full_frames += 1
+            self.pushed_area += screen_area
+        else:
+            pygame.display.update(dirty)
+            self.pushed_area += area
+        self.full_redraw = False
+        self.previous = self.current
+
+    def stats(self):
+        screen_area = self.surface.get_width() * self.surface.get_height()
+        pushed = self.pushed_area / max(1, self.frames * screen_area) * 100
+        return (f"{self.frames} frames, {self.full_frames} full flips, "
+                f"{pushed:.1f}% of the screen sent per frame")
+
+
+# Sky and ground of the playing screen, the dirty renderer restores from it
+playing_background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+playing_background.fill(WHITE)
+playing_background.blit(ground_image, (0, SCREEN_HEIGHT - GROUND_HEIGHT))
 
 def draw_text_center(surface, text, font, color, y_offset=0):
     render = font.render(text, True, color)
@@ -322,6 +514,7 @@ def main():
     STATE_WIN = 3
 
     state = STATE_START
+    renderer = DirtyRenderer(screen, playing_background)
 
     player = Player()
     all_sprites = pygame.sprite.Group()
@@ -337,6 +530,7 @@ def main():
     for _ in range(5):
         cloud = Cloud()
         all_clouds.add(cloud)
+    targets = SpatialHash()  # enemies and boss, re-indexed every frame for collisions
 
     score = 0
     boss_spawned = False
@@ -365,6 +559,8 @@ def main():
                     except:
                         pass
 
+                    for sprite in all_sprites:
+                        sprite.kill()  # pooled sprites go back to their pool
                     player = Player()
                     all_sprites = pygame.sprite.Group()
                     all_sprites.add(player)
@@ -408,18 +604,20 @@ def main():
                     if event.key == pygame.K_f:
                         if boss_spawned:
                             y_offset = 10
-                            fireball = Projectile(player.rect.right, player.rect.centery - y_offset, super_fire=False)
-                            superfireball = Projectile(player.rect.right, player.rect.centery + y_offset, super_fire=True)
+                            fireball = pools["projectile"].spawn(player.rect.right, player.rect.centery - y_offset, False)
+                            superfireball = pools["projectile"].spawn(player.rect.right, player.rect.centery + y_offset, True)
                             all_sprites.add(fireball, superfireball)
                             projectiles.add(fireball, superfireball)
                         else:
-                            projectile = Projectile(player.rect.right, player.rect.centery - 10, super_fire=super_fireball_unlocked)
+                            projectile = pools["projectile"].spawn(player.rect.right, player.rect.centery - 10, super_fireball_unlocked)
                             all_sprites.add(projectile)
                             projectiles.add(projectile)
 
             elif state == STATE_GAMEOVER or state == STATE_WIN:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
+                        for sprite in all_sprites:
+                            sprite.kill()  # pooled sprites go back to their pool
                         player = Player()
                         all_sprites = pygame.sprite.Group()
                         all_sprites.add(player)
@@ -456,6 +654,8 @@ def main():
 
         if state == STATE_GAMEOVER or state == STATE_WIN:
             pygame.mixer.music.stop()
+        if state != STATE_PLAYING:
+            renderer.invalidate()
 
         if state == STATE_START:
             if menu_background:
@@ -478,7 +678,7 @@ def main():
                 if not super_fireball_unlocked:
                     super_fireball_unlocked = True
                 if len(enemies2) < 3 and random.randint(1, 100) < 10:
-                    enemy2 = Enemy2()
+                    enemy2 = pools["enemy2"].spawn()
                     all_sprites.add(enemy2)
                     enemies2.add(enemy2)
                     if not level_2_shown:
@@ -489,7 +689,7 @@ def main():
 
             if score >= 1200 and not boss_spawned:
                 if len(enemies3) < 3 and random.randint(1, 100) < 8:
-                    enemy3 = Enemy3()
+                    enemy3 = pools["enemy3"].spawn()
                     all_sprites.add(enemy3)
                     enemies3.add(enemy3)
                     if not level_3_shown:
@@ -512,7 +712,7 @@ def main():
 
             if boss_spawned and (current_time - last_boss_shot_time) > boss_shoot_cooldown:
                 for b in boss_group:
-                    bullet = BossBullet(b.rect.left, b.rect.centery)
+                    bullet = pools["boss_bullet"].spawn(b.rect.left, b.rect.centery)
                     all_sprites.add(bullet)
                     boss_bullets.add(bullet)
                 last_boss_shot_time = current_time
@@ -520,7 +720,7 @@ def main():
             if not boss_spawned and score < 500:
                 spawn_chance = min(2 + score // 100, 5)
                 if random.randint(1, 100) < spawn_chance:
-                    enemy = Enemy()
+                    enemy = pools["enemy"].spawn()
                     all_sprites.add(enemy)
                     enemies.add(enemy)
 
@@ -528,8 +728,12 @@ def main():
             enemies2.update()
             enemies3.update()
 
+            # broad phase: each projectile only checks the targets in its grid cells,
+            # then the masks of those whose rects overlap it
+            if projectiles:
+                targets.build((enemies, enemies2, enemies3, boss_group))
             for projectile in projectiles:
-                enemy_hits = pygame.sprite.spritecollide(projectile, enemies, False)
+                enemy_hits, enemy2_hits, enemy3_hits, boss_hits = targets.collide(projectile)
                 for enemy in enemy_hits:
                     enemy.health -= 20
                     projectile.kill()
@@ -537,7 +741,6 @@ def main():
                         enemy.kill()
                         score += 10
 
-                enemy2_hits = pygame.sprite.spritecollide(projectile, enemies2, False)
                 for enemy2 in enemy2_hits:
                     if projectile.super_fire:
                         enemy2.health -= 20
@@ -546,7 +749,6 @@ def main():
                             enemy2.kill()
                             score += 20
 
-                enemy3_hits = pygame.sprite.spritecollide(projectile, enemies3, False)
                 for enemy3 in enemy3_hits:
                     enemy3.health -= 25
                     projectile.kill()
@@ -554,7 +756,6 @@ def main():
                         enemy3.kill()
                         score += 30
 
-                boss_hits = pygame.sprite.spritecollide(projectile, boss_group, False)
                 for boss in boss_hits:
                     boss.health -= 1
                     projectile.kill()
@@ -564,66 +765,65 @@ def main():
                         boss_spawned = False
                         state = STATE_WIN
 
-            if pygame.sprite.spritecollide(player, enemies, False):
+            if pygame.sprite.spritecollide(player, enemies, False, collide_precise):
                 player.take_damage(DAMAGE)
-            if pygame.sprite.spritecollide(player, enemies2, False):
+            if pygame.sprite.spritecollide(player, enemies2, False, collide_precise):
                 player.take_damage(DAMAGE + 5)
-            if pygame.sprite.spritecollide(player, enemies3, False):
+            if pygame.sprite.spritecollide(player, enemies3, False, collide_precise):
                 player.take_damage(DAMAGE + 10)
-            if pygame.sprite.spritecollide(player, boss_group, False):
+            if pygame.sprite.spritecollide(player, boss_group, False, collide_precise):
                 player.take_damage(DAMAGE + 10)
 
-            if pygame.sprite.spritecollide(player, boss_bullets, True):
+            if pygame.sprite.spritecollide(player, boss_bullets, True, collide_precise):
                 player.take_damage(DAMAGE + 8)
 
             if len(collectibles) < 3:
                 if random.randint(1, 100) < 5:
-                    collectible = Collectible()
+                    collectible = pools["collectible"].spawn()
                     all_sprites.add(collectible)
                     collectibles.add(collectible)
 
-            collected = pygame.sprite.spritecollide(player, collectibles, True)
+            collected = pygame.sprite.spritecollide(player, collectibles, True, collide_precise)
             for item in collected:
                 score += 50
 
-            screen.fill(WHITE)
-            all_clouds.draw(screen)
-            screen.blit(ground_image, (0, SCREEN_HEIGHT - GROUND_HEIGHT))
-            all_sprites.draw(screen)
+            # sky and ground come from the cached background, only changed rects are sent
+            renderer.begin()
+            renderer.draw_group(all_clouds)
+            renderer.draw_group(all_sprites)
 
             health_bar_back = pygame.Rect(10, 10, 200, 25)
             health_bar_front = pygame.Rect(10, 10, 200 * (player.health / player.max_health), 25)
-            pygame.draw.rect(screen, RED, health_bar_back)
-            pygame.draw.rect(screen, GREEN, health_bar_front)
+            renderer.add(pygame.draw.rect(screen, RED, health_bar_back))
+            renderer.add(pygame.draw.rect(screen, GREEN, health_bar_front))
 
             lives_text = small_font.render(f"Lives: {player.lives}", True, RED)
             score_text = small_font.render(f"Score: {score}", True, BLACK)
-            screen.blit(lives_text, (10, 45))
-            screen.blit(score_text, (SCREEN_WIDTH - 150, 10))
+            renderer.blit(lives_text, (10, 45))
+            renderer.blit(score_text, (SCREEN_WIDTH - 150, 10))
 
             if boss_spawned and len(boss_group) > 0:
                 boss = next(iter(boss_group))
                 boss_bar_back = pygame.Rect(SCREEN_WIDTH//2 - 100, 50, 200, 20)
                 boss_bar_front = pygame.Rect(SCREEN_WIDTH//2 - 100, 50, 200 * (boss.health / boss.max_health), 20)
-                pygame.draw.rect(screen, RED, boss_bar_back)
-                pygame.draw.rect(screen, GREEN, boss_bar_front)
+                renderer.add(pygame.draw.rect(screen, RED, boss_bar_back))
+                renderer.add(pygame.draw.rect(screen, GREEN, boss_bar_front))
                 boss_text = small_font.render("Boss Health", True, BLACK)
-                screen.blit(boss_text, (SCREEN_WIDTH//2 - boss_text.get_width()//2, 20))
+                renderer.blit(boss_text, (SCREEN_WIDTH//2 - boss_text.get_width()//2, 20))
 
             if level_text is not None:
                 elapsed = current_time - level_text_start_time
                 if elapsed < level_text_duration:
-                    large_font = pygame.font.SysFont("Arial", 72)
                     text_render = large_font.render(level_text, True, ORANGE)
                     text_rect = text_render.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 200))
                     shadow_render = large_font.render(level_text, True, BLACK)
                     shadow_rect = shadow_render.get_rect(center=(SCREEN_WIDTH//2 + 3, SCREEN_HEIGHT//2 - 197))
-                    screen.blit(shadow_render, shadow_rect)
-                    screen.blit(text_render, text_rect)
+                    renderer.blit(shadow_render, shadow_rect)
+                    renderer.blit(text_render, text_rect)
                 else:
                     level_text = None
 
-            pygame.display.flip()
+            renderer.end()
 
             if player.lives <= 0:
                 state = STATE_GAMEOVER
@@ -650,6 +850,10 @@ def main():
 
 
 
+    print(f"Assets: {assets.stats()}")
+    print(f"Rendering: {renderer.stats()}")
+    for pool in pools.values():
+        print(f"Pool {pool.stats()}")
     pygame.quit()
 
 if __name__ == "__main__":
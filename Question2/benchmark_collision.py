@@ -0,0 +1,120 @@
+"""Time the projectile collision checks of the game with and without the spatial hash.
+
+    python benchmark_collision.py
+    python benchmark_collision.py --counts 10,100,1000 --frames 50
+    python benchmark_collision.py --masks --counts 10,100 --frames 5
+
+Every group (projectiles, the three enemy kinds and the boss group) gets the same number
+of sprites at random positions of the playing field, with the sizes the game uses. The
+old loop calls spritecollide per projectile and group, the new one builds the grid once
+per frame and asks it. Both have to find the same pairs.
+
+--masks gives the sprites round images and compares pixel exact checks: collide_mask
+building masks on every call against the grid with masks built once per image."""
+
+import argparse
+import random
+import sys
+import time
+import pygame
+from collision import SpatialHash
+
+SCREEN_WIDTH = 1000
+SCREEN_HEIGHT = 800
+# Sprite sizes of the groups, in the order the game checks them
+TARGET_SIZES = ((50, 50), (60, 60), (70, 70), (120, 120))
+PROJECTILE_SIZE = (20, 20)
+
+
+def round_image(size):
+    # a disc on a transparent square, like a sprite with padding around it
+    image = pygame.Surface(size, pygame.SRCALPHA)
+    pygame.draw.ellipse(image, (255, 255, 255, 255), image.get_rect())
+    return image
+
+
+def make_group(count, size, rng, masks=False):
+    group = pygame.sprite.Group()
+    image = round_image(size) if masks else None
+    mask = pygame.mask.from_surface(image) if masks else None
+    for _ in range(count):
+        sprite = pygame.sprite.Sprite()
+        sprite.rect = pygame.Rect(rng.randrange(SCREEN_WIDTH - size[0]),
+                                  rng.randrange(SCREEN_HEIGHT - size[1]), *size)
+        if masks:
+            sprite.image = image
+            sprite.cached_mask = mask
+        group.add(sprite)
+    return group
+
+
+def uncached_mask(left, right):
+    # pygame.sprite.collide_mask on sprites without a .mask: both masks built per call
+    offset = (right.rect.x - left.rect.x, right.rect.y - left.rect.y)
+    return pygame.mask.from_surface(left.image).overlap(
+        pygame.mask.from_surface(right.image), offset) is not None
+
+
+def mask_loop(projectiles, targets):
+    return [[pygame.sprite.spritecollide(p, group, False, uncached_mask) for group in targets]
+            for p in projectiles]
+
+
+def rect_loop(projectiles, targets):
+    # what main() did: one spritecollide per projectile and target group
+    return [[pygame.sprite.spritecollide(p, group, False) for group in targets]
+            for p in projectiles]
+
+
+def grid_loop(projectiles, targets, grid):
+    grid.build(targets)
+    return [grid.collide(p) for p in projectiles]
+
+
+def pairs(results):
+    return {(i, g, id(s)) for i, hits in enumerate(results)
+            for g, group in enumerate(hits) for s in group}
+
+
+def measure(func, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        result = func()
+    return (time.perf_counter() - start) / frames * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark projectile collision checks.")
+    parser.add_argument("--counts", default="10,100,1000",
+                        help="comma separated sprites per group (default: 10,100,1000)")
+    parser.add_argument("--frames", type=int, default=20, help="frames timed per count")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--masks", action="store_true",
+                        help="pixel exact checks: uncached collide_mask against cached masks")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    grid = SpatialHash()
+    old_name = "collide_mask" if args.masks else "rect loop"
+    print(f"{'per group':>10} {old_name:>12} {'grid':>12} {'speedup':>8} {'pairs':>7}")
+    for count in (int(v) for v in args.counts.split(",")):
+        projectiles = make_group(count, PROJECTILE_SIZE, rng, args.masks)
+        targets = [make_group(count, size, rng, args.masks) for size in TARGET_SIZES]
+        if args.masks:
+            old_ms, old = measure(lambda: mask_loop(projectiles, targets), args.frames)
+            for group in [projectiles] + targets:
+                for sprite in group:
+                    sprite.mask = sprite.cached_mask
+        else:
+            old_ms, old = measure(lambda: rect_loop(projectiles, targets), args.frames)
+        new_ms, new = measure(lambda: grid_loop(projectiles, targets, grid), args.frames)
+        if pairs(old) != pairs(new):
+            print(f"{count}: the grid found different pairs", file=sys.stderr)
+            return 1
+        print(f"{count:>10} {old_ms:>9.3f} ms {new_ms:>9.3f} ms {old_ms / new_ms:>7.1f}x "
+              f"{len(pairs(new)):>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
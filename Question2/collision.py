@@ -0,0 +1,78 @@
+# Side of a grid cell in pixels, a bit above the biggest sprite (the 120 px boss), so a
+# sprite touches at most 4 cells. Each sprite is listed in every cell its rect touches
+# and a query only looks at sprites in the cells of its own rect.
+CELL_SIZE = 128
+
+
+# Spatial hash: a uniform grid over sprite rects, the broad phase of the collision checks.
+# Rebuilt once per frame from the target groups, then every projectile only tests the
+# sprites sharing a cell with it instead of every sprite of every group.
+class SpatialHash:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.group_count = 0
+
+    def cell_range(self, rect):
+        size = self.cell_size
+        # right/bottom are exclusive, a rect ending on a cell edge doesn't touch the next cell
+        return (range(rect.left // size, (rect.right - 1) // size + 1),
+                range(rect.top // size, (rect.bottom - 1) // size + 1))
+
+    # Index the sprites of several groups, remembering which group each came from.
+    # A cell keeps the rects in one list so collidelistall() can test them all in C.
+    def build(self, groups):
+        self.cells = cells = {}
+        self.group_count = len(groups)
+        size = self.cell_size
+        for index, group in enumerate(groups):
+            for sprite in group:
+                rect = sprite.rect
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+                    for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                        cell = cells.get((cx, cy))
+                        if cell is None:
+                            cell = cells[(cx, cy)] = ([], [])
+                        cell[0].append(rect)
+                        cell[1].append((index, sprite))
+
+    # Sprites of each indexed group that touch sprite, one list per group: the rects
+    # come from the grid, the pixel masks are only compared for those. Sprites killed
+    # since build() are skipped, like spritecollide would.
+    def collide(self, sprite):
+        rect = sprite.rect
+        hits = [[] for _ in range(self.group_count)]
+        columns, rows = self.cell_range(rect)
+        # a sprite spanning several of the cells is found once per cell
+        seen = set() if len(columns) * len(rows) > 1 else None
+        for cx in columns:
+            for cy in rows:
+                cell = self.cells.get((cx, cy))
+                if cell is None:
+                    continue
+                entries = cell[1]
+                for i in rect.collidelistall(cell[0]):
+                    index, other = entries[i]
+                    if seen is not None:
+                        if other in seen:
+                            continue
+                        seen.add(other)
+                    if other.alive() and masks_overlap(sprite, other):
+                        hits[index].append(other)
+        return hits
+
+
+# Narrow phase for two sprites whose rects overlap: compare their cached masks (set by
+# the asset manager), sprites without a mask count as solid rectangles
+def masks_overlap(left, right):
+    left_mask = getattr(left, "mask", None)
+    right_mask = getattr(right, "mask", None)
+    if left_mask is None or right_mask is None:
+        return True
+    offset = (right.rect.x - left.rect.x, right.rect.y - left.rect.y)
+    return left_mask.overlap(right_mask, offset) is not None
+
+
+# Collision test for spritecollide: the rects first, the masks only when they overlap
+def collide_precise(left, right):
+    return left.rect.colliderect(right.rect) and masks_overlap(left, right)